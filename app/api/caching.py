@@ -0,0 +1,101 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Callable, Hashable, Iterable, Optional
+
+from fastapi import Request, Response
+
+# Below this, gzip costs more than it saves
+GZIP_MIN_BYTES = 1024
+
+
+class CachedResponse:
+    """
+    A JSON response serialized (and gzipped) once, with a strong ETag over its
+    bytes and Last-Modified set to the freshness of the data behind it.
+    `api_key_ids` are the developers whose entries the body shows.
+    """
+
+    def __init__(self, body: bytes, last_modified: datetime, api_key_ids: Iterable[str] = ()):
+        self.body = body
+        self.gzip_body = gzip.compress(body, compresslevel=6) if len(body) >= GZIP_MIN_BYTES else None
+        digest = hashlib.sha1(body).hexdigest()
+        self.etag = f'"{digest}"'
+        # The gzip body is a different representation, so it needs its own strong tag
+        self.gzip_etag = f'"{digest}-gzip"'
+        self.last_modified = last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+        self.api_key_ids = frozenset(api_key_ids)
+        self.size = len(body) + len(self.gzip_body or b"") + sum(len(key) for key in self.api_key_ids)
+
+    def respond(self, request: Request) -> Response:
+        gzipped = self.gzip_body is not None and "gzip" in request.headers.get("accept-encoding", "")
+        headers = {
+            "ETag": self.gzip_etag if gzipped else self.etag,
+            "Last-Modified": format_datetime(self.last_modified, usegmt=True),
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+        if self._not_modified(request):
+            return Response(status_code=304, headers=headers)
+        if gzipped:
+            headers["Content-Encoding"] = "gzip"
+            return Response(self.gzip_body, media_type="application/json", headers=headers)
+        return Response(self.body, media_type="application/json", headers=headers)
+
+    def _not_modified(self, request: Request) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            # If-None-Match takes precedence and uses weak comparison (RFC 9110 13.1.2)
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            return "*" in tags or self.etag in tags or self.gzip_etag in tags
+
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since is not None:
+            try:
+                return self.last_modified <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+class ResponseCache:
+    """
+    LRU of CachedResponses, bounded both by count and by the bytes of their
+    bodies. Keys must include whatever versions the data, so stale entries
+    simply age out.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        with self._lock:
+            response = self._entries.get(key)
+            if response is not None:
+                self._entries.move_to_end(key)
+            return response
+
+    def put(self, key: Hashable, response: CachedResponse):
+        if response.size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous.size
+            self._entries[key] = response
+            self.bytes += response.size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self.bytes -= self._entries.popitem(last=False)[1].size
+
+    def discard(self, predicate: Callable[[Hashable], bool]):
+        """Drop every entry whose key matches, for changes the keys don't version."""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                self.bytes -= self._entries.pop(key).size
@@ -1,21 +1,40 @@
+import asyncio
+import functools
 import logging
 from datetime import datetime, date, timedelta
-from typing import Optional
-from fastapi import APIRouter, HTTPException, Query, Depends, BackgroundTasks
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from fastapi import APIRouter, HTTPException, Query, Depends, BackgroundTasks, Request
+from fastapi.responses import StreamingResponse
 from rococo.data import PostgreSQLAdapter
 
 from app.config import get_settings, Settings
+from app.database import create_adapter, run_in_db_executor
 from app.models import Developer
-from app.repositories import DeveloperRepository, UsageSnapshotRepository
+from app.repositories import DeveloperRepository, UsageSnapshotRepository, UsageRollupRepository
 from app.services.leaderboard import (
+    RankedLeaderboard,
     calculate_leaderboard,
     get_developer_rankings,
     calculate_cache_rate,
+    get_period_window,
+    load_ranked,
+    load_ranked_range,
+    ranked_flights,
 )
-from app.services.scheduler import fetch_usage_for_api_key
+from app.services.leader import leader_election
+from app.services.leaderboard_cache import leaderboard_cache
+from app.services.leaderboard_materializer import leaderboard_materializer
+from app.services.leaderboard_stream import leaderboard_broadcaster
+from app.services.model_catalog import model_catalog
+from app.services.registration_queue import registration_queue
+from app.services.single_flight import SingleFlight
+from app.services.snapshot_maintenance import compaction_cutoff
+from app.api.caching import CachedResponse, ResponseCache
 from app.api.schemas import (
     RegisterRequest,
     RegisterResponse,
+    RegistrationStatusResponse,
+    UsageFetchStatus,
     DeveloperResponse,
     LeaderboardResponse,
     DeveloperStatsResponse,
@@ -28,23 +47,47 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+leaderboard_responses = ResponseCache(
+    max_entries=get_settings().leaderboard_response_cache_size,
+    max_bytes=get_settings().leaderboard_response_cache_bytes,
+)
+response_flights = SingleFlight("leaderboard response")
+stats_flights = SingleFlight("developer stats")
+
 
 def get_adapter():
-    settings = get_settings()
-    adapter = PostgreSQLAdapter(
-        settings.database_host,
-        settings.database_port,
-        settings.database_user,
-        settings.database_password,
-        settings.database_name,
-    )
+    adapter = create_adapter()
     with adapter:
         yield adapter
 
 
+def _upsert_developer(dev_repo: DeveloperRepository, request: RegisterRequest) -> Tuple[Developer, bool]:
+    """Create or rename the developer; also returns whether it was newly created."""
+    existing = dev_repo.get_by_api_key_id(request.api_key_id)
+    if existing:
+        existing.name = request.name
+        return dev_repo.save(existing), False
+    developer = Developer(
+        api_key_id=request.api_key_id,
+        name=request.name,
+        registered_at=datetime.utcnow(),
+    )
+    return dev_repo.save(developer), True
+
+
 @router.get("/health", response_model=HealthResponse)
 async def health_check():
-    return HealthResponse(status="healthy", timestamp=datetime.utcnow())
+    return HealthResponse(
+        status="healthy",
+        timestamp=datetime.utcnow(),
+        cache=leaderboard_cache.stats(),
+        materializer=leaderboard_materializer.stats(),
+        streams=leaderboard_broadcaster.stats(),
+        flights={flights.name: flights.stats() for flights in (ranked_flights, response_flights, stats_flights)},
+        instance_id=leader_election.instance_id,
+        is_leader=leader_election.is_leader,
+        leader_id=leader_election.leader_id,
+    )
 
 
 @router.post("/register", response_model=RegisterResponse)
@@ -54,26 +97,13 @@ async def register_developer(
 ):
     try:
         dev_repo = DeveloperRepository(adapter)
+        developer, created = await run_in_db_executor(_upsert_developer, dev_repo, request)
+        # The developer's own cached pages show their (previous, or masked) name
+        leaderboard_responses.discard(lambda key: key[-1] == request.api_key_id)
 
-        existing = dev_repo.get_by_api_key_id(request.api_key_id)
-        if existing:
-            existing.name = request.name
-            developer = dev_repo.save(existing)
-        else:
-            developer = Developer(
-                api_key_id=request.api_key_id,
-                name=request.name,
-                registered_at=datetime.utcnow(),
-            )
-            developer = dev_repo.save(developer)
-
-        # Fetch usage data immediately (only 1 API page now, safe for rate limits)
-        try:
-            fetched_count = await fetch_usage_for_api_key(request.api_key_id)
-            logger.info(f"Fetched {fetched_count} usage snapshots on registration for {request.api_key_id[:10]}...")
-        except Exception as e:
-            # Don't fail registration if usage fetch fails
-            logger.warning(f"Failed to fetch usage on registration: {e}")
+        # Today's usage is fetched in the background, coalesced with other registrations;
+        # new keys also get their history backfilled
+        fetch_status = registration_queue.enqueue(request.api_key_id, backfill=created)
 
         return RegisterResponse(
             success=True,
@@ -83,115 +113,265 @@ async def register_developer(
                 name=developer.name,
                 registered_at=developer.registered_at,
             ),
+            usage_fetch=UsageFetchStatus(**fetch_status),
         )
     except Exception as e:
         return RegisterResponse(success=False, error=str(e))
 
 
+def _get_developer(api_key_id: str) -> Optional[Developer]:
+    """Blocking; run it on the DB executor."""
+    adapter = create_adapter()
+    with adapter:
+        return DeveloperRepository(adapter).get_by_api_key_id(api_key_id)
+
+
+@router.get("/register/{api_key_id}/status", response_model=RegistrationStatusResponse)
+async def get_registration_status(api_key_id: str):
+    """Poll the usage fetch queued by /register."""
+    fetch_status = registration_queue.get_status(api_key_id)
+    if fetch_status is None:
+        # Only this fallback needs a connection; polls answered from the queue take none
+        if not await run_in_db_executor(_get_developer, api_key_id):
+            raise HTTPException(status_code=404, detail="Developer not found")
+        # Registered through another worker, or long enough ago to be forgotten
+        fetch_status = {"status": "unknown"}
+    return RegistrationStatusResponse(api_key_id=api_key_id, usage_fetch=UsageFetchStatus(**fetch_status))
+
+
 @router.get("/models")
 async def get_available_models(
-    adapter: PostgreSQLAdapter = Depends(get_adapter),
+    period: Optional[str] = Query(None, pattern="^(day|week|month)$", description="Only models used in this period"),
 ):
-    """Get list of models that have usage data."""
-    usage_repo = UsageSnapshotRepository(adapter)
-    models = usage_repo.get_distinct_models()
-    return {"models": models}
+    """Get list of models that have usage data, served from the in-memory model catalogue."""
+    await model_catalog.ensure_loaded()
+    since = get_period_window(period)[0] if period else None
+    return {"models": model_catalog.get_models(since)}
+
+
+def _build_leaderboard_response(
+    ranked: RankedLeaderboard,
+    period: str,
+    api_key_id: Optional[str],
+    model: Optional[str],
+    limit: Optional[int],
+    offset: int,
+    around: Optional[str],
+    date_range: Optional[Tuple[date, date]] = None,
+) -> CachedResponse:
+    """Page and serialize one leaderboard response. Blocking; run it on the DB executor."""
+    adapter = create_adapter()
+    with adapter:
+        leaderboard = calculate_leaderboard(
+            usage_repo=UsageSnapshotRepository(adapter),
+            dev_repo=DeveloperRepository(adapter),
+            period=period,
+            current_user_api_key_id=api_key_id,
+            model=model,
+            limit=limit,
+            offset=offset,
+            around=around,
+            ranked=ranked,
+        )
+    body = LeaderboardResponse(
+        period=period,
+        categories=leaderboard["categories"],
+        updated_at=leaderboard["updated_at"],
+        model=model,
+        total=leaderboard["total"],
+        start=date_range[0] if date_range else None,
+        end=date_range[1] if date_range else None,
+    ).model_dump_json().encode()
+    return CachedResponse(body, last_modified=leaderboard["updated_at"], api_key_ids=leaderboard["api_key_ids"])
+
+
+async def _leaderboard_response(
+    key: Tuple,
+    load: Callable[[], Awaitable[RankedLeaderboard]],
+    period: str,
+    api_key_id: Optional[str],
+    model: Optional[str],
+    limit: Optional[int],
+    offset: int,
+    around: Optional[str],
+    date_range: Optional[Tuple[date, date]] = None,
+) -> CachedResponse:
+    """
+    The cached response for one page, building it from `load()` on a miss.
+    Pages are cached as seen by anyone; only when api_key_id's own entry is
+    on the page is the caller's variant (unmasked, is_self set) built and
+    cached under its own key, ending with api_key_id, so arbitrary
+    api_key_ids can't multiply the entries.
+    """
+    async def get(key: Tuple, api_key_id: Optional[str]) -> CachedResponse:
+        cached = leaderboard_responses.get(key)
+        if cached is None:
+            ranked = await load()
+            cached = await response_flights.do(key, functools.partial(
+                run_in_db_executor, _build_leaderboard_response,
+                ranked, period, api_key_id, model, limit, offset, around, date_range,
+            ))
+            leaderboard_responses.put(key, cached)
+        return cached
+
+    cached = await get(key, None)
+    if api_key_id is None or api_key_id not in cached.api_key_ids:
+        return cached
+    return await get((*key, api_key_id), api_key_id)
 
 
 @router.get("/leaderboard", response_model=LeaderboardResponse)
 async def get_leaderboard(
+    request: Request,
     period: str = Query("week", pattern="^(day|week|month)$"),
     api_key_id: Optional[str] = Query(None, description="Current user's API key ID for unmasking"),
     model: Optional[str] = Query(None, description="Filter by model (e.g., claude-sonnet-4-20250514)"),
-    adapter: PostgreSQLAdapter = Depends(get_adapter),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Entries per category (default: all)"),
+    offset: int = Query(0, ge=0, description="Entries to skip per category"),
+    around: Optional[str] = Query(None, description="Return the `limit` entries centred on this API key ID"),
+    start: Optional[date] = Query(None, description="First day of a custom range (overrides `period`)"),
+    end: Optional[date] = Query(None, description="Last day of a custom range (default: today)"),
 ):
-    dev_repo = DeveloperRepository(adapter)
-    usage_repo = UsageSnapshotRepository(adapter)
+    """
+    Responses are serialized once per data version and served with ETag and
+    Last-Modified; a matching If-None-Match / If-Modified-Since gets a 304
+    without touching the database. Concurrent identical requests share one
+    computation, and after new usage arrives the previous leaderboard is
+    served while it is recomputed in the background.
 
-    categories = calculate_leaderboard(
-        usage_repo=usage_repo,
-        dev_repo=dev_repo,
-        period=period,
-        current_user_api_key_id=api_key_id,
-        model=model,
-    )
+    With `start` (and optionally `end`) the leaderboard covers that date
+    range instead of a period, summed from the running totals in
+    usage_cumulative; its responses are cached until usage changes.
+    """
+    if start is not None or end is not None:
+        if start is None:
+            raise HTTPException(status_code=400, detail="`end` requires `start`")
+        end = end or date.today()
+        if start > end:
+            raise HTTPException(status_code=400, detail="`start` must not be after `end`")
+        if start == date.min:
+            # Range totals subtract the running totals of the day before `start`
+            raise HTTPException(status_code=400, detail=f"`start` must be after {date.min}")
+        cutoff = compaction_cutoff()
+        if cutoff is not None and (
+            (start < cutoff and start.day != 1) or (end < cutoff and (end + timedelta(days=1)).day != 1)
+        ):
+            # A compacted month's usage is all dated on its first day, so a partial month would be all or nothing
+            raise HTTPException(
+                status_code=400,
+                detail=f"Usage before {cutoff} is kept per month: `start` and `end` before it must be a month's first and last day",
+            )
+        key = ("range", start, end, model, leaderboard_cache.generation, limit, offset, around)
+        cached = await _leaderboard_response(
+            key, functools.partial(load_ranked_range, start, end, model),
+            "custom", api_key_id, model, limit, offset, around, (start, end),
+        )
+        return cached.respond(request)
 
-    return LeaderboardResponse(
-        period=period,
-        categories=categories,
-        updated_at=datetime.utcnow(),
-        model=model,
-    )
+    ranked = await load_ranked(period, model)
 
+    async def loaded() -> RankedLeaderboard:
+        return ranked
 
-@router.get("/developer/{api_key_id}/stats", response_model=DeveloperStatsResponse)
-async def get_developer_stats(
-    api_key_id: str,
+    key = (ranked.version, limit, offset, around)
+    cached = await _leaderboard_response(key, loaded, period, api_key_id, model, limit, offset, around)
+    return cached.respond(request)
+
+
+@router.get("/leaderboard/stream")
+async def stream_leaderboard(
+    request: Request,
+    period: str = Query("week", pattern="^(day|week|month)$"),
+    api_key_id: Optional[str] = Query(None, description="Current user's API key ID for `self` events"),
     model: Optional[str] = Query(None, description="Filter by model (e.g., claude-sonnet-4-20250514)"),
-    adapter: PostgreSQLAdapter = Depends(get_adapter),
 ):
-    dev_repo = DeveloperRepository(adapter)
-    usage_repo = UsageSnapshotRepository(adapter)
+    """
+    Server-Sent Events stream of leaderboard changes for (period, model).
 
-    developer = dev_repo.get_by_api_key_id(api_key_id)
-    if not developer:
-        raise HTTPException(status_code=404, detail="Developer not found")
+    Events: `diff` (changed and removed entries per category, masked like
+    /leaderboard), `self` (the caller's own ranks, when they changed) and
+    `resync` (the client fell behind and should refetch /leaderboard).
+    """
+    subscriber = await leaderboard_broadcaster.subscribe(period, model, api_key_id)
 
-    history = usage_repo.get_developer_history(api_key_id, days=30, model=model)
+    async def events():
+        try:
+            yield ": connected\n\n"
+            while not await request.is_disconnected():
+                try:
+                    yield await asyncio.wait_for(subscriber.queue.get(), timeout=15.0)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+        finally:
+            leaderboard_broadcaster.unsubscribe(subscriber)
 
-    daily_history = []
-    for snapshot in history:
-        total_tokens = (
-            snapshot.uncached_input_tokens
-            + snapshot.cache_read_input_tokens
-            + snapshot.output_tokens
-        )
-        cache_rate = calculate_cache_rate(
-            snapshot.cache_read_input_tokens,
-            snapshot.uncached_input_tokens,
-        )
-        daily_history.append(DailyStats(
-            date=snapshot.snapshot_date,
-            total_tokens=total_tokens,
-            uncached_input_tokens=snapshot.uncached_input_tokens,
-            cache_read_input_tokens=snapshot.cache_read_input_tokens,
-            output_tokens=snapshot.output_tokens,
-            cache_rate=cache_rate,
-            web_search_requests=snapshot.web_search_requests,
-        ))
-
-    def calculate_period_stats(days: int) -> PeriodStats:
-        today = date.today()
-        start_date = today - timedelta(days=days)
-        period_snapshots = [s for s in history if s.snapshot_date >= start_date]
-
-        total_uncached = sum(s.uncached_input_tokens for s in period_snapshots)
-        total_cache_read = sum(s.cache_read_input_tokens for s in period_snapshots)
-        total_output = sum(s.output_tokens for s in period_snapshots)
-        total_web_search = sum(s.web_search_requests for s in period_snapshots)
-
-        return PeriodStats(
-            total_tokens=total_uncached + total_cache_read + total_output,
-            uncached_input_tokens=total_uncached,
-            cache_read_input_tokens=total_cache_read,
-            output_tokens=total_output,
-            cache_rate=calculate_cache_rate(total_cache_read, total_uncached),
-            web_search_requests=total_web_search,
-        )
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    current_period = {
-        "day": calculate_period_stats(1),
-        "week": calculate_period_stats(7),
-        "month": calculate_period_stats(30),
+
+def _usage_totals(row: Dict[str, int]) -> Dict:
+    """PeriodStats / DailyStats fields from summed counters."""
+    return {
+        "total_tokens": row["uncached_input_tokens"] + row["cache_read_input_tokens"] + row["output_tokens"],
+        "uncached_input_tokens": row["uncached_input_tokens"],
+        "cache_read_input_tokens": row["cache_read_input_tokens"],
+        "output_tokens": row["output_tokens"],
+        "cache_rate": calculate_cache_rate(row["cache_read_input_tokens"], row["uncached_input_tokens"]),
+        "web_search_requests": row["web_search_requests"],
     }
 
-    rankings = get_developer_rankings(usage_repo, dev_repo, api_key_id, "week", model=model)
+
+def _load_developer_stats(
+    api_key_id: str, model: Optional[str]
+) -> Optional[Tuple[Developer, List[Dict], Dict[str, Dict], Dict[str, Dict]]]:
+    """
+    The developer with their 30-day daily and period totals and weekly
+    rankings, or None if they aren't registered. Blocking; run it on the DB
+    executor. Everything is read through one adapter, so a request never
+    holds a connection while waiting for another.
+    """
+    adapter = create_adapter()
+    with adapter:
+        developer = DeveloperRepository(adapter).get_by_api_key_id(api_key_id)
+        if developer is None:
+            return None
+        usage_repo = UsageSnapshotRepository(adapter)
+        daily, periods = usage_repo.get_developer_stats(api_key_id, days=30, model=model)
+        rankings = get_developer_rankings(
+            usage_repo,
+            DeveloperRepository(adapter),
+            api_key_id,
+            "week",
+            model=model,
+            rollup_repo=UsageRollupRepository(adapter),
+        )
+    return developer, daily, periods, rankings
+
+
+@router.get("/developer/{api_key_id}/stats", response_model=DeveloperStatsResponse)
+async def get_developer_stats(
+    api_key_id: str,
+    model: Optional[str] = Query(None, description="Filter by model (e.g., claude-sonnet-4-20250514)"),
+):
+    # Concurrent views of the same profile share one load until usage changes
+    key = (api_key_id, model, date.today(), leaderboard_cache.generation)
+    stats = await stats_flights.do(
+        key, functools.partial(run_in_db_executor, _load_developer_stats, api_key_id, model)
+    )
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Developer not found")
+    developer, daily, periods, rankings = stats
 
     return DeveloperStatsResponse(
         api_key_id=api_key_id,
         name=developer.name,
-        current_period=current_period,
-        daily_history=daily_history,
-        rankings=rankings,
+        current_period={period: PeriodStats(**_usage_totals(totals)) for period, totals in periods.items()},
+        daily_history=[DailyStats(date=row["snapshot_date"], **_usage_totals(row)) for row in daily],
+        rankings={category: r["rank"] for category, r in rankings.items()},
+        percentiles={category: r["percentile"] for category, r in rankings.items()},
         model=model,
     )
@@ -15,12 +15,26 @@ class DeveloperResponse(BaseModel):
     registered_at: datetime
 
 
+class UsageFetchStatus(BaseModel):
+    status: str
+    queued_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    snapshots_fetched: Optional[int] = None
+    error: Optional[str] = None
+
+
 class RegisterResponse(BaseModel):
     success: bool
     developer: Optional[DeveloperResponse] = None
+    usage_fetch: Optional[UsageFetchStatus] = None
     error: Optional[str] = None
 
 
+class RegistrationStatusResponse(BaseModel):
+    api_key_id: str
+    usage_fetch: UsageFetchStatus
+
+
 class LeaderboardEntry(BaseModel):
     rank: int
     display_name: str
@@ -34,6 +48,9 @@ class LeaderboardResponse(BaseModel):
     categories: Dict[str, List[LeaderboardEntry]]
     updated_at: datetime
     model: Optional[str] = None
+    total: Optional[int] = None
+    start: Optional[date] = None
+    end: Optional[date] = None
 
 
 class DailyStats(BaseModel):
@@ -61,9 +78,17 @@ class DeveloperStatsResponse(BaseModel):
     current_period: Dict[str, PeriodStats]
     daily_history: List[DailyStats]
     rankings: Dict[str, int]
+    percentiles: Dict[str, float] = {}
     model: Optional[str] = None
 
 
 class HealthResponse(BaseModel):
     status: str
     timestamp: datetime
+    cache: Optional[Dict[str, int]] = None
+    materializer: Optional[Dict[str, int]] = None
+    streams: Optional[Dict[str, int]] = None
+    flights: Optional[Dict[str, Dict[str, int]]] = None
+    instance_id: Optional[str] = None
+    is_leader: Optional[bool] = None
+    leader_id: Optional[str] = None
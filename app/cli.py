@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import logging
+from datetime import date
+
+from app.database import create_adapter, close_pool, shutdown_db_executor
+from app.services.anthropic_client import close_admin_client
+from app.services.backfill import default_backfill_range, run_backfill
+from app.services.rollups import refresh_rollups, refresh_cumulative
+from app.services.snapshot_maintenance import maintain_snapshots
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+
+
+def rebuild_rollups(args: argparse.Namespace):
+    adapter = create_adapter()
+    refresh_rollups(adapter)
+    refresh_cumulative(adapter)
+
+
+def maintain_snapshot_storage(args: argparse.Namespace):
+    maintain_snapshots(create_adapter())
+
+
+def backfill(args: argparse.Namespace):
+    default_start, default_end = default_backfill_range()
+
+    async def run():
+        try:
+            await run_backfill(
+                start_date=args.start or default_start,
+                end_date=args.end or default_end,
+                api_key_ids=args.api_key_id,
+                job_name=args.job_name,
+                window_days=args.window_days,
+                concurrency=args.concurrency,
+                requests_per_minute=args.requests_per_minute,
+            )
+        finally:
+            await close_admin_client()
+
+    asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Baroque maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = subparsers.add_parser("rebuild-rollups", help="Recompute usage_rollup and usage_cumulative from usage_snapshot")
+    rebuild.set_defaults(func=rebuild_rollups)
+
+    maintain = subparsers.add_parser(
+        "maintain-snapshots",
+        help="Create upcoming usage_snapshot partitions and compact months past SNAPSHOT_COMPACT_AFTER_MONTHS",
+    )
+    maintain.set_defaults(func=maintain_snapshot_storage)
+
+    backfill_parser = subparsers.add_parser(
+        "backfill",
+        help="Fetch historical usage for a date range; re-running resumes from the last checkpoint",
+    )
+    backfill_parser.add_argument("--start", type=date.fromisoformat, help="First UTC day (default: BACKFILL_DAYS ago)")
+    backfill_parser.add_argument("--end", type=date.fromisoformat, help="Last UTC day (default: yesterday)")
+    backfill_parser.add_argument(
+        "--api-key-id", action="append", help="Only backfill this key (repeatable; default: all registered)"
+    )
+    backfill_parser.add_argument("--job-name", help="Checkpoint namespace (default: all)")
+    backfill_parser.add_argument("--window-days", type=int)
+    backfill_parser.add_argument("--concurrency", type=int)
+    backfill_parser.add_argument("--requests-per-minute", type=int)
+    backfill_parser.set_defaults(func=backfill)
+
+    args = parser.parse_args()
+    try:
+        args.func(args)
+    finally:
+        shutdown_db_executor()
+        close_pool()
+
+
+if __name__ == "__main__":
+    main()
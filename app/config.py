@@ -8,11 +8,46 @@ class Settings(BaseSettings):
     database_user: str = "postgres"
     database_password: str = "secret"
     database_name: str = "baroque"
+    database_pool_min_size: int = 1
+    database_pool_max_size: int = 10
+    database_pool_timeout_seconds: float = 30.0
 
     anthropic_admin_api_key: str = ""
+    anthropic_max_retries: int = 5
+    anthropic_backoff_base_seconds: float = 1.0
+    anthropic_backoff_max_seconds: float = 60.0
+    usage_report_keys_per_request: int = 100
+    usage_report_parallel_requests: int = 4
     frontend_url: str = "http://localhost:5173"
 
     fetch_interval_minutes: int = 5
+    scheduler_lock_key: int = 7291845
+    # The usage report keeps correcting buckets for up to a day after the hour
+    ingest_lookback_hours: int = 24
+    ingest_hourly_retention_days: int = 7
+    ingest_batch_size: int = 5000
+
+    # usage_snapshot is partitioned by month; partitions are created this far ahead
+    snapshot_partitions_ahead_months: int = 3
+    # Daily snapshots older than this many months are merged into one row per
+    # developer, model and month (0 disables compaction)
+    snapshot_compact_after_months: int = 13
+
+    registration_coalesce_seconds: float = 2.0
+
+    backfill_days: int = 30
+    backfill_window_days: int = 7
+    backfill_concurrency: int = 4
+    backfill_requests_per_minute: int = 30
+
+    leaderboard_cache_max_models: int = 16
+    leaderboard_stream_queue_size: int = 32
+    leaderboard_response_cache_size: int = 1024
+    # Bodies (identity plus gzip) held by the response cache, in bytes
+    leaderboard_response_cache_bytes: int = 64 * 1024 * 1024
+    leaderboard_stale_while_revalidate: bool = True
+    # "python", or "numpy" for the vectorized engine (requires NumPy)
+    leaderboard_engine: str = "python"
 
     class Config:
         env_file = ".env"
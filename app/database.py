@@ -0,0 +1,213 @@
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+from rococo.data import PostgreSQLAdapter
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    """
+    Process-wide pool of PostgreSQL connections.
+
+    Wraps psycopg2's ThreadedConnectionPool so that callers block (up to
+    `timeout` seconds) instead of failing when every connection is checked out,
+    and validates connections before handing them out.
+    """
+
+    def __init__(self, min_size: int, max_size: int, timeout: float = 30.0, **connect_kwargs):
+        self._pool = ThreadedConnectionPool(min_size, max_size, **connect_kwargs)
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._timeout = timeout
+        self.max_size = max_size
+
+    def getconn(self):
+        if not self._slots.acquire(timeout=self._timeout):
+            raise PoolError("Timed out waiting for a database connection")
+        try:
+            conn = self._pool.getconn()
+            if not self._is_healthy(conn):
+                logger.warning("Discarding broken pooled database connection")
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn):
+        try:
+            if conn.closed:
+                self._pool.putconn(conn, close=True)
+                return
+            # Never hand a connection with an open transaction to the next caller
+            if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            self._pool.putconn(conn)
+        except Exception as e:
+            logger.warning(f"Failed to return connection to pool: {e}")
+            try:
+                self._pool.putconn(conn, close=True)
+            except Exception:
+                pass
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        self._pool.closeall()
+
+    @staticmethod
+    def _is_healthy(conn) -> bool:
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+
+class PooledPostgreSQLAdapter(PostgreSQLAdapter):
+    """
+    PostgreSQLAdapter that borrows its connection from the shared pool.
+
+    Rococo repositories wrap every call in `with adapter:`, so entries are
+    reference counted: the outermost `with` checks a connection out and nested
+    ones reuse it, returning it to the pool only when the outermost block exits.
+    """
+
+    def __init__(self, pool: ConnectionPool):
+        settings = get_settings()
+        super().__init__(
+            settings.database_host,
+            settings.database_port,
+            settings.database_user,
+            settings.database_password,
+            settings.database_name,
+        )
+        self._pool = pool
+        self._depth = 0
+        # Table schemas don't change at runtime; share the lookup across adapters
+        self._table_columns_cache = _table_columns_cache
+
+    def __enter__(self):
+        if self._depth == 0:
+            self._connection = self._pool.getconn()
+            self._cursor = self._connection.cursor()
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._depth -= 1
+        if self._depth == 0:
+            self.close_connection()
+
+    @contextmanager
+    def transaction(self) -> Iterator[extensions.cursor]:
+        """
+        A cursor on this adapter's connection, for statements rococo's
+        execute_query / run_transaction can't express (execute_values,
+        RETURNING, positional rows). Commits when the block exits normally
+        and rolls back if it raises.
+        """
+        with self:
+            try:
+                yield self._cursor
+            except BaseException:
+                self._connection.rollback()
+                raise
+            self._connection.commit()
+
+    def close_connection(self):
+        if self._cursor is not None:
+            self._cursor.close()
+            self._cursor = None
+        if self._connection is not None:
+            self._pool.putconn(self._connection)
+            self._connection = None
+        self._depth = 0
+
+
+_table_columns_cache = {}
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                settings = get_settings()
+                _pool = ConnectionPool(
+                    settings.database_pool_min_size,
+                    settings.database_pool_max_size,
+                    timeout=settings.database_pool_timeout_seconds,
+                    host=settings.database_host,
+                    port=settings.database_port,
+                    user=settings.database_user,
+                    password=settings.database_password,
+                    database=settings.database_name,
+                )
+                logger.info(
+                    f"Database pool created (min={settings.database_pool_min_size}, "
+                    f"max={settings.database_pool_max_size})"
+                )
+    return _pool
+
+
+def create_adapter() -> PooledPostgreSQLAdapter:
+    return PooledPostgreSQLAdapter(get_pool())
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            logger.info("Database pool closed")
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """
+    Thread pool that runs blocking repository calls off the event loop.
+
+    Sized to the connection pool so a worker thread never waits on a connection
+    held by another thread of the same executor.
+    """
+    global _executor
+    if _executor is None:
+        with _pool_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=get_settings().database_pool_max_size,
+                    thread_name_prefix="db",
+                )
+    return _executor
+
+
+async def run_in_db_executor(func: Callable[..., Any], *args, **kwargs) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_db_executor(), functools.partial(func, *args, **kwargs))
+
+
+def shutdown_db_executor():
+    global _executor
+    with _pool_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
@@ -4,10 +4,19 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.config import get_settings
-from app.api.routes import router
+from app.database import get_pool, close_pool, shutdown_db_executor
+from app.api.routes import router, health_check
 from app.api.schemas import HealthResponse
-from app.services.scheduler import start_scheduler, stop_scheduler, fetch_usage_data
-from datetime import datetime
+from app.services.anthropic_client import get_admin_client, close_admin_client
+from app.services.backfill import cancel_backfills, schedule_backfill
+from app.services.leader import leader_election
+from app.services.leaderboard_cache import leaderboard_cache
+from app.services.leaderboard_materializer import leaderboard_materializer
+from app.services.leaderboard_stream import leaderboard_broadcaster
+from app.services.model_catalog import model_catalog
+from app.services.registration_queue import registration_queue
+from app.services.usage_listener import usage_listener
+from app.services.scheduler import start_scheduler, stop_scheduler, run_scheduled_fetch
 
 logging.basicConfig(
     level=logging.INFO,
@@ -21,14 +30,42 @@ async def lifespan(app: FastAPI):
     settings = get_settings()
     logger.info("Starting up...")
 
+    get_pool()
+    get_admin_client()
+
+    # Invalidate first so the materializer and broadcaster recompute from fresh data
+    usage_listener.add_handler(leaderboard_cache.invalidate)
+    usage_listener.add_handler(leaderboard_materializer.on_usage_changed)
+    usage_listener.add_handler(leaderboard_broadcaster.on_usage_changed)
+    usage_listener.add_handler(model_catalog.on_usage_changed)
+    await usage_listener.start()
+    # Warm every leaderboard from the existing rollups, and load the model catalogue
+    leaderboard_materializer.on_usage_changed()
+    model_catalog.on_usage_changed()
+    await registration_queue.start()
+
     start_scheduler(interval_minutes=settings.fetch_interval_minutes)
 
-    await fetch_usage_data()
+    # Only the elected leader fetches at boot; the others wait for their next tick
+    await run_scheduled_fetch()
+    if leader_election.is_leader:
+        # Resumable, so a fresh install fills the month window and later boots skip finished windows
+        schedule_backfill(job_name="initial")
+        await registration_queue.resume_backfills()
 
     yield
 
     logger.info("Shutting down...")
     stop_scheduler()
+    await registration_queue.stop()
+    await cancel_backfills()
+    await close_admin_client()
+    await usage_listener.stop()
+    await leaderboard_materializer.stop()
+    await model_catalog.stop()
+    await leaderboard_broadcaster.stop()
+    shutdown_db_executor()
+    close_pool()
 
 
 def create_app() -> FastAPI:
@@ -52,9 +89,7 @@ def create_app() -> FastAPI:
     app.include_router(router, prefix="/api")
 
     # Root-level health check (as documented in plan)
-    @app.get("/health", response_model=HealthResponse)
-    async def root_health_check():
-        return HealthResponse(status="healthy", timestamp=datetime.utcnow())
+    app.add_api_route("/health", health_check, methods=["GET"], response_model=HealthResponse)
 
     return app
 
@@ -1,4 +1,4 @@
 from .developer import Developer
-from .usage import UsageSnapshot
+from .usage import UsageSnapshot, UsageCounters
 
-__all__ = ["Developer", "UsageSnapshot"]
+__all__ = ["Developer", "UsageSnapshot", "UsageCounters"]
@@ -1,5 +1,6 @@
 from dataclasses import dataclass, field
 from datetime import datetime, date
+from typing import NamedTuple
 from rococo.models import BaseModel
 
 
@@ -15,3 +16,20 @@ class UsageSnapshot(BaseModel):
     output_tokens: int = 0
     web_search_requests: int = 0
     fetched_at: datetime = field(default_factory=datetime.utcnow)
+
+
+class UsageCounters(NamedTuple):
+    """
+    Read-only projection of a usage_snapshot row for aggregation: just the
+    key and counter columns, decoded straight from the cursor's tuples
+    without building a UsageSnapshot.
+    """
+    api_key_id: str
+    snapshot_date: date
+    model: str
+    uncached_input_tokens: int
+    cache_read_input_tokens: int
+    cache_creation_5m_tokens: int
+    cache_creation_1h_tokens: int
+    output_tokens: int
+    web_search_requests: int
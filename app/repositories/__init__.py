@@ -1,4 +1,17 @@
 from .developer_repo import DeveloperRepository
 from .usage_repo import UsageSnapshotRepository
+from .rollup_repo import UsageRollupRepository
+from .cumulative_repo import UsageCumulativeRepository
+from .hourly_repo import UsageHourlyRepository
+from .backfill_repo import BackfillCheckpointRepository
+from .model_catalog_repo import ModelCatalogRepository
 
-__all__ = ["DeveloperRepository", "UsageSnapshotRepository"]
+__all__ = [
+    "DeveloperRepository",
+    "UsageSnapshotRepository",
+    "UsageRollupRepository",
+    "UsageCumulativeRepository",
+    "UsageHourlyRepository",
+    "BackfillCheckpointRepository",
+    "ModelCatalogRepository",
+]
@@ -0,0 +1,37 @@
+from typing import Collection, Set, Tuple
+from datetime import date
+from rococo.data import PostgreSQLAdapter
+
+
+class BackfillCheckpointRepository:
+    """Completed backfill windows (backfill_checkpoint), keyed by job name."""
+
+    def __init__(self, adapter: PostgreSQLAdapter):
+        self.adapter = adapter
+
+    def get_completed_windows(self, job_names: Collection[str]) -> Set[Tuple[date, date]]:
+        """Windows checkpointed under every one of job_names."""
+        with self.adapter:
+            results = self.adapter.execute_query(
+                """
+                SELECT window_start, window_end FROM backfill_checkpoint
+                WHERE job_name = ANY(%s)
+                GROUP BY window_start, window_end
+                HAVING COUNT(*) = %s
+                """,
+                (list(job_names), len(job_names)),
+            )
+        return {(row["window_start"], row["window_end"]) for row in results or []}
+
+    def mark_completed(self, job_names: Collection[str], window_start: date, window_end: date, snapshots_written: int):
+        with self.adapter:
+            self.adapter.run_transaction([(
+                """
+                INSERT INTO backfill_checkpoint (job_name, window_start, window_end, snapshots_written, completed_at)
+                SELECT job_name, %s, %s, %s, NOW() FROM unnest(%s::varchar[]) AS jobs(job_name)
+                ON CONFLICT (job_name, window_start, window_end) DO UPDATE SET
+                    snapshots_written = EXCLUDED.snapshots_written,
+                    completed_at = EXCLUDED.completed_at
+                """,
+                (window_start, window_end, snapshots_written, list(job_names)),
+            )])
@@ -0,0 +1,149 @@
+from typing import Dict, Optional, Tuple
+from datetime import date, datetime, timedelta
+from rococo.data import PostgreSQLAdapter
+from app.repositories.usage_repo import COUNTER_COLUMNS
+
+
+class UsageCumulativeRepository:
+    """
+    Running per-developer, per-model totals kept in usage_cumulative.
+
+    Each row holds the totals up to its snapshot_date and is current until
+    valid_until, so the totals over any [start, end] are the row current on
+    `end` minus the row current on `start - 1`: two index probes per
+    developer whatever the length of the range.
+    """
+
+    def __init__(self, adapter: PostgreSQLAdapter):
+        self.adapter = adapter
+
+    def refresh(self, since: Dict[str, date]):
+        """Recompute {api_key_id: first changed day}'s running totals from that day on."""
+        if since:
+            keys = sorted(since)
+            self._refresh(
+                "SELECT * FROM unnest(%s::varchar[], %s::date[]) AS changed(api_key_id, since)",
+                (keys, [since[key] for key in keys]),
+                min(since.values()),
+            )
+
+    def refresh_all(self, since: date = date.min):
+        """Recompute every developer's running totals from `since` on (from the start by default)."""
+        self._refresh(
+            """
+            SELECT api_key_id, %s::date AS since FROM (
+                SELECT api_key_id FROM usage_cumulative
+                UNION SELECT api_key_id FROM usage_snapshot WHERE snapshot_date >= %s
+            ) keys
+            """,
+            (since, since),
+            since,
+        )
+
+    def _refresh(self, changed: str, params: Tuple, earliest: date):
+        """
+        Drop the changed developers' rows from their `since` on, rebuild them
+        from usage_snapshot on top of the last row before it, then re-point
+        that row's valid_until at the first rebuilt one. `changed` is a query
+        yielding (api_key_id, since) rows; `earliest` is the smallest since,
+        repeated as a constant so partitions are pruned and the validity
+        index is used instead of scanning every row.
+        """
+        # Rows current on or after the day before `earliest`: everything dropped plus the rows before it
+        from_earliest = "daterange(c.snapshot_date, c.valid_until) && daterange(%s::date - 1, NULL)"
+        next_row = """COALESCE((
+            SELECT MIN(n.snapshot_date) FROM usage_cumulative n
+            WHERE n.api_key_id = c.api_key_id AND n.model = c.model AND n.snapshot_date > c.snapshot_date
+        ), 'infinity')"""
+        counters = ", ".join(COUNTER_COLUMNS)
+        computed_at = datetime.utcnow()
+        queries = [
+            # Concurrent refreshes of the same developer would both insert the rebuilt rows
+            ("SELECT pg_advisory_xact_lock(hashtext('usage_cumulative'))", ()),
+            (
+                f"""
+                DELETE FROM usage_cumulative c USING ({changed}) ch
+                WHERE c.api_key_id = ch.api_key_id AND c.snapshot_date >= ch.since AND {from_earliest}
+                """,
+                (*params, earliest),
+            ),
+            (
+                f"""
+                INSERT INTO usage_cumulative (api_key_id, model, snapshot_date, valid_until, {counters}, computed_at)
+                WITH rebuilt AS (
+                    SELECT s.api_key_id, s.model, s.snapshot_date, ch.since, {", ".join(f"s.{c}" for c in COUNTER_COLUMNS)}
+                    FROM usage_snapshot s
+                    JOIN ({changed}) ch ON s.api_key_id = ch.api_key_id AND s.snapshot_date >= ch.since
+                    WHERE s.active = true AND s.snapshot_date >= %s
+                ), base AS (
+                    SELECT series.api_key_id, series.model, {", ".join(f"b.{c}" for c in COUNTER_COLUMNS)}
+                    FROM (SELECT DISTINCT api_key_id, model, since FROM rebuilt) series
+                    JOIN LATERAL (
+                        SELECT {counters} FROM usage_cumulative c
+                        WHERE c.api_key_id = series.api_key_id AND c.model = series.model
+                            AND c.snapshot_date < series.since
+                        ORDER BY c.snapshot_date DESC
+                        LIMIT 1
+                    ) b ON true
+                )
+                SELECT r.api_key_id, r.model, r.snapshot_date,
+                       COALESCE(LEAD(r.snapshot_date) OVER w, 'infinity'),
+                       {", ".join(f"COALESCE(base.{c}, 0) + SUM(r.{c}) OVER w" for c in COUNTER_COLUMNS)},
+                       %s
+                FROM rebuilt r
+                LEFT JOIN base ON base.api_key_id = r.api_key_id AND base.model = r.model
+                WINDOW w AS (PARTITION BY r.api_key_id, r.model ORDER BY r.snapshot_date)
+                """,
+                (*params, earliest, computed_at),
+            ),
+            (
+                # The last row before `since` is now current until the first rebuilt one, if any
+                f"""
+                UPDATE usage_cumulative c SET valid_until = {next_row}
+                FROM ({changed}) ch
+                WHERE c.api_key_id = ch.api_key_id AND c.snapshot_date < ch.since AND c.valid_until >= ch.since
+                    AND {from_earliest} AND c.valid_until <> {next_row}
+                """,
+                (*params, earliest),
+            ),
+        ]
+        with self.adapter:
+            self.adapter.run_transaction(queries)
+
+    def get_range_totals(
+        self, start_date: date, end_date: date, model: Optional[str] = None
+    ) -> Tuple[Optional[datetime], Dict[str, Dict]]:
+        """
+        Return (computed_at, {api_key_id: counters}) over [start_date,
+        end_date] for developers with snapshots in the range, summed over
+        every model unless one is given. computed_at is when the totals last
+        changed (None without any developer).
+        """
+        model_filter = " AND model = %s" if model else ""
+        current_on = f"""
+            SELECT api_key_id, model, snapshot_date, computed_at, {", ".join(COUNTER_COLUMNS)}
+            FROM usage_cumulative
+            WHERE daterange(snapshot_date, valid_until) @> %s::date{model_filter}
+        """
+        model_params = [model] if model else []
+        params = (end_date, *model_params, start_date - timedelta(days=1), *model_params, start_date)
+        with self.adapter.transaction() as cursor:
+            cursor.execute(
+                f"""
+                SELECT upto_end.api_key_id, MAX(upto_end.computed_at),
+                       {", ".join(f"SUM(upto_end.{c} - COALESCE(before_start.{c}, 0))" for c in COUNTER_COLUMNS)}
+                FROM ({current_on}) upto_end
+                LEFT JOIN ({current_on}) before_start
+                    ON before_start.api_key_id = upto_end.api_key_id AND before_start.model = upto_end.model
+                WHERE upto_end.snapshot_date >= %s
+                GROUP BY upto_end.api_key_id
+                """,
+                params,
+            )
+            rows = cursor.fetchall()
+
+        computed_at = max((row[1] for row in rows), default=None)
+        return computed_at, {
+            api_key_id: dict(zip(COUNTER_COLUMNS, map(int, counters)))
+            for api_key_id, _, *counters in rows
+        }
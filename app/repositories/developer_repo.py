@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import Optional, List
 from rococo.repositories.postgresql import PostgreSQLRepository
 from rococo.data import PostgreSQLAdapter
@@ -18,3 +19,6 @@ class DeveloperRepository(PostgreSQLRepository):
     def get_all_api_key_ids(self) -> List[str]:
         developers = self.get_all_active()
         return [dev.api_key_id for dev in developers]
+
+    def get_registered_since(self, since: datetime) -> List[Developer]:
+        return [dev for dev in self.get_all_active() if dev.registered_at >= since]
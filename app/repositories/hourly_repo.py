@@ -0,0 +1,90 @@
+from typing import Optional, List, Iterable, Tuple
+from datetime import date, datetime, timedelta
+from psycopg2.extras import execute_values
+from rococo.data import PostgreSQLAdapter
+from app.models import UsageSnapshot
+from app.repositories.usage_repo import COUNTER_COLUMNS
+
+# (api_key_id, bucket_start, model, *COUNTER_COLUMNS)
+HourlyRow = Tuple
+
+
+class UsageHourlyRepository:
+    """Hourly usage buckets (usage_hourly) and ingestion watermarks."""
+
+    def __init__(self, adapter: PostgreSQLAdapter):
+        self.adapter = adapter
+
+    def get_watermark(self, name: str) -> Optional[datetime]:
+        with self.adapter:
+            results = self.adapter.execute_query(
+                "SELECT watermark FROM ingestion_watermark WHERE name = %s", (name,)
+            )
+        return results[0]["watermark"] if results else None
+
+    def set_watermark(self, name: str, watermark: datetime):
+        with self.adapter:
+            self.adapter.run_transaction([(
+                """
+                INSERT INTO ingestion_watermark (name, watermark, updated_at)
+                VALUES (%s, %s, NOW())
+                ON CONFLICT (name) DO UPDATE SET
+                    watermark = EXCLUDED.watermark,
+                    updated_at = EXCLUDED.updated_at
+                """,
+                (name, watermark),
+            )])
+
+    def upsert_buckets(self, rows: Iterable[HourlyRow], fetched_at: datetime) -> List[Tuple[str, datetime, str]]:
+        """
+        Upsert hourly buckets, skipping unchanged ones. Returns the
+        (api_key_id, bucket_start, model) keys that were inserted or updated.
+        """
+        # ON CONFLICT can't touch the same row twice in one statement, so the last value per key wins
+        deduped = {(row[0], row[1], row[2]): (*row, fetched_at) for row in rows}
+        if not deduped:
+            return []
+
+        counters = ", ".join(COUNTER_COLUMNS)
+        query = f"""
+            INSERT INTO usage_hourly (api_key_id, bucket_start, model, {counters}, fetched_at)
+            VALUES %s
+            ON CONFLICT (api_key_id, bucket_start, model) DO UPDATE SET
+                {", ".join(f"{c} = EXCLUDED.{c}" for c in COUNTER_COLUMNS)},
+                fetched_at = EXCLUDED.fetched_at
+            WHERE ({", ".join(f"usage_hourly.{c}" for c in COUNTER_COLUMNS)})
+                IS DISTINCT FROM ({", ".join(f"EXCLUDED.{c}" for c in COUNTER_COLUMNS)})
+            RETURNING api_key_id, bucket_start, model
+        """
+        with self.adapter.transaction() as cursor:
+            written = execute_values(cursor, query, list(deduped.values()), page_size=1000, fetch=True)
+        return written
+
+    def get_daily_totals(self, api_key_ids: List[str], start_date: date, end_date: date) -> List[UsageSnapshot]:
+        """Sum the hourly buckets of the given developers into daily snapshots for [start_date, end_date]."""
+        with self.adapter:
+            results = self.adapter.execute_query(
+                f"""
+                SELECT api_key_id, bucket_start::date AS snapshot_date, model,
+                       {", ".join(f"SUM({c}) AS {c}" for c in COUNTER_COLUMNS)}
+                FROM usage_hourly
+                WHERE api_key_id = ANY(%s) AND bucket_start >= %s AND bucket_start < %s
+                GROUP BY api_key_id, bucket_start::date, model
+                """,
+                (list(api_key_ids), start_date, end_date + timedelta(days=1)),
+            )
+        fetched_at = datetime.utcnow()
+        return [
+            UsageSnapshot(
+                api_key_id=row["api_key_id"],
+                snapshot_date=row["snapshot_date"],
+                model=row["model"],
+                fetched_at=fetched_at,
+                **{c: int(row[c]) for c in COUNTER_COLUMNS},
+            )
+            for row in results or []
+        ]
+
+    def prune_before(self, cutoff: datetime):
+        with self.adapter:
+            self.adapter.execute_query("DELETE FROM usage_hourly WHERE bucket_start < %s", (cutoff,))
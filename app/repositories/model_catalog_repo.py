@@ -0,0 +1,16 @@
+from typing import Dict, List
+from rococo.data import PostgreSQLAdapter
+
+
+class ModelCatalogRepository:
+    """Models with usage (model_catalog). Rows are written by UsageSnapshotRepository.bulk_upsert_snapshots."""
+
+    def __init__(self, adapter: PostgreSQLAdapter):
+        self.adapter = adapter
+
+    def get_all(self) -> List[Dict]:
+        with self.adapter:
+            results = self.adapter.execute_query(
+                "SELECT model, first_seen, last_seen, snapshot_count FROM model_catalog ORDER BY model", ()
+            )
+        return results or []
@@ -0,0 +1,223 @@
+from typing import Optional, List, Dict, Tuple
+from datetime import date, datetime
+from rococo.data import PostgreSQLAdapter
+from app.repositories.usage_repo import COUNTER_COLUMNS
+
+ALL_MODELS = "*"
+
+
+def percentage(part: int, whole: int) -> float:
+    """
+    part / whole in percent, rounded half up to 2 decimals on the exact
+    ratio (0.0 when whole is 0). Integer arithmetic, so it agrees with
+    _percentage_sql; rounding the float quotient would not, as ROUND(numeric)
+    and Python's round() break ties differently.
+    """
+    if whole == 0:
+        return 0.0
+    return (part * 20000 + whole) // (2 * whole) / 100
+
+
+def _percentage_sql(part: str, whole: str) -> str:
+    """The SQL twin of percentage(); div() on numerics is an exact integer quotient."""
+    return f"""
+        CASE WHEN {whole} > 0
+            THEN div({part}::numeric * 20000 + ({whole}), 2 * ({whole})::numeric) / 100
+            ELSE 0 END"""
+
+
+# Category scores as rank_categories computes them in app/services/leaderboard.py
+CATEGORY_VALUE_SQL = {
+    "efficient_user": _percentage_sql("output_tokens", "uncached_input_tokens + cache_read_input_tokens"),
+    "cache_champion": _percentage_sql("cache_read_input_tokens", "uncached_input_tokens + cache_read_input_tokens"),
+    "wordsmith": "output_tokens",
+    "tool_master": "web_search_requests",
+}
+
+
+class UsageRollupRepository:
+    """Per-developer window totals kept in usage_rollup / usage_rollup_state."""
+
+    def __init__(self, adapter: PostgreSQLAdapter):
+        self.adapter = adapter
+
+    def refresh(self, windows: Dict[str, Tuple[date, date]], api_key_ids: Optional[List[str]] = None):
+        """
+        Recompute the rollups for each period's (start, end) window.
+
+        Every period is summed in one scan over the snapshots spanning all the
+        windows: each period's totals are FILTERed sums, unpivoted into one
+        row per period for developers with any usage in that window.
+
+        With api_key_ids only those developers' rows are rebuilt, which is
+        enough after a fetch as long as the windows themselves haven't moved.
+        """
+        periods = list(windows)
+        counters = ", ".join(COUNTER_COLUMNS)
+        key_filter = " AND api_key_id = ANY(%s)" if api_key_ids is not None else ""
+        computed_at = datetime.utcnow()
+
+        window_sums, window_values, unpivot = [], [], []
+        for i, period in enumerate(periods):
+            in_window = "snapshot_date >= %s AND snapshot_date <= %s"
+            window_sums.append(f"COUNT(*) FILTER (WHERE {in_window}) AS rows_{i}")
+            window_sums += [f"SUM({c}) FILTER (WHERE {in_window}) AS {c}_{i}" for c in COUNTER_COLUMNS]
+            window_values += list(windows[period]) * (len(COUNTER_COLUMNS) + 1)
+            unpivot.append(f"(%s, rows_{i}, {', '.join(f'{c}_{i}' for c in COUNTER_COLUMNS)})")
+
+        values = [*window_values, ALL_MODELS, min(start for start, _ in windows.values()),
+                  max(end for _, end in windows.values())]
+        if api_key_ids is not None:
+            values.append(list(api_key_ids))
+        values += periods
+
+        if api_key_ids is None:
+            delete = ("DELETE FROM usage_rollup WHERE period = ANY(%s)", (periods,))
+        else:
+            delete = (
+                "DELETE FROM usage_rollup WHERE period = ANY(%s) AND api_key_id = ANY(%s)",
+                (periods, list(api_key_ids)),
+            )
+        # Concurrent refreshes (backfill windows, the scheduled fetch) would delete and
+        # re-insert the same rows; the second INSERT would then hit a unique violation
+        queries = [("SELECT pg_advisory_xact_lock(hashtext('usage_rollup'))", ()), delete, (
+            f"""
+            INSERT INTO usage_rollup (period, model, api_key_id, {counters})
+            SELECT p.period, totals.model, totals.api_key_id, {", ".join(f"p.{c}" for c in COUNTER_COLUMNS)}
+            FROM (
+                SELECT {", ".join(window_sums)}, COALESCE(model, %s) AS model, api_key_id
+                FROM usage_snapshot
+                WHERE snapshot_date >= %s AND snapshot_date <= %s AND active = true{key_filter}
+                GROUP BY GROUPING SETS ((api_key_id), (api_key_id, model))
+            ) totals
+            CROSS JOIN LATERAL (VALUES {", ".join(unpivot)}) AS p(period, rows, {counters})
+            WHERE p.rows > 0
+            """,
+            tuple(values),
+        )]
+        for period, (start_date, end_date) in windows.items():
+            queries.append((
+                """
+                INSERT INTO usage_rollup_state (period, window_start, window_end, computed_at)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (period) DO UPDATE SET
+                    window_start = EXCLUDED.window_start,
+                    window_end = EXCLUDED.window_end,
+                    computed_at = EXCLUDED.computed_at
+                """,
+                (period, start_date, end_date, computed_at),
+            ))
+
+        with self.adapter:
+            self.adapter.run_transaction(queries)
+
+    def get_windows(self) -> Dict[str, Tuple[date, date]]:
+        with self.adapter:
+            results = self.adapter.execute_query(
+                "SELECT period, window_start, window_end FROM usage_rollup_state", ()
+            )
+        return {row["period"]: (row["window_start"], row["window_end"]) for row in results or []}
+
+    def get_computed_at(self, period: str) -> Optional[datetime]:
+        """When the period's rollup last changed, i.e. the freshness of the data it serves (UTC)."""
+        with self.adapter:
+            results = self.adapter.execute_query(
+                "SELECT computed_at FROM usage_rollup_state WHERE period = %s", (period,)
+            )
+        return results[0]["computed_at"] if results else None
+
+    def get_period_totals(
+        self,
+        period: str,
+        window: Tuple[date, date],
+        model: Optional[str] = None,
+    ) -> Optional[Dict[str, Dict]]:
+        """
+        Return {api_key_id: counters} for the period, or None when the stored
+        rollup was computed for a different window than the one requested.
+        """
+        with self.adapter:
+            if self.get_windows().get(period) != window:
+                return None
+            results = self.adapter.execute_query(
+                f"""
+                SELECT api_key_id, {", ".join(COUNTER_COLUMNS)} FROM usage_rollup
+                WHERE period = %s AND model = %s
+                """,
+                (period, model or ALL_MODELS),
+            )
+        return {
+            row["api_key_id"]: {c: row[c] for c in COUNTER_COLUMNS}
+            for row in results or []
+        }
+
+    def get_all_period_totals(
+        self, windows: Dict[str, Tuple[date, date]]
+    ) -> Dict[str, Tuple[Optional[datetime], Dict[Optional[str], Dict[str, Dict]]]]:
+        """
+        Return {period: (computed_at, {model: {api_key_id: counters}})} for
+        every model at once, model None being the all-models total. Periods
+        whose stored rollup was computed for a different window are left out.
+        """
+        if not windows:
+            return {}
+        periods = list(windows)
+        # One statement, so the state and the rows come from the same refresh
+        with self.adapter.transaction() as cursor:
+            cursor.execute(
+                f"""
+                SELECT state.period, state.computed_at, rollup.model, rollup.api_key_id,
+                       {", ".join(f"rollup.{c}" for c in COUNTER_COLUMNS)}
+                FROM usage_rollup_state state
+                JOIN unnest(%s::text[], %s::date[], %s::date[]) AS requested(period, window_start, window_end)
+                    ON requested.period = state.period
+                    AND requested.window_start = state.window_start
+                    AND requested.window_end = state.window_end
+                LEFT JOIN usage_rollup rollup ON rollup.period = state.period
+                """,
+                (periods, [windows[period][0] for period in periods], [windows[period][1] for period in periods]),
+            )
+            rows = cursor.fetchall()
+
+        totals = {}
+        for period, computed_at, model, api_key_id, *counters in rows:
+            models = totals.setdefault(period, (computed_at, {}))[1]
+            if api_key_id is not None:
+                models.setdefault(None if model == ALL_MODELS else model, {})[api_key_id] = dict(zip(COUNTER_COLUMNS, counters))
+        return totals
+
+    def get_ranks(
+        self,
+        period: str,
+        window: Tuple[date, date],
+        api_key_id: str,
+        model: Optional[str] = None,
+    ) -> Optional[Tuple[Dict[str, int], int]]:
+        """
+        Return ({category: rank}, total developers) for one developer, where
+        rank is 1 + the number of developers scoring strictly higher (0 if the
+        developer has no usage in the period). Counted in one pass over the
+        period's rollup rows without sorting; None when the rollup is stale.
+        """
+        categories = list(CATEGORY_VALUE_SQL)
+        with self.adapter:
+            if self.get_windows().get(period) != window:
+                return None
+            # execute_query only returns rows for statements starting with SELECT, so no CTE
+            scores = f"""
+                SELECT api_key_id, {", ".join(f"{CATEGORY_VALUE_SQL[c]} AS {c}" for c in categories)}
+                FROM usage_rollup
+                WHERE period = %s AND model = %s
+            """
+            results = self.adapter.execute_query(
+                f"""
+                SELECT COUNT(*) AS total, COUNT(me.api_key_id) > 0 AS ranked,
+                       {", ".join(f"COUNT(*) FILTER (WHERE scores.{c} > me.{c}) AS {c}" for c in categories)}
+                FROM ({scores}) scores
+                LEFT JOIN ({scores} AND api_key_id = %s) me ON true
+                """,
+                (period, model or ALL_MODELS, period, model or ALL_MODELS, api_key_id),
+            )
+        row = results[0]
+        ranks = {c: int(row[c]) + 1 if row["ranked"] else 0 for c in categories}
+        return ranks, int(row["total"])
@@ -1,8 +1,42 @@
-from typing import Optional, List
+import json
+from typing import Optional, List, Dict, Iterable, Set, Tuple
 from datetime import date, timedelta
+from uuid import uuid4
+from psycopg2.extras import execute_values
 from rococo.repositories.postgresql import PostgreSQLRepository
 from rococo.data import PostgreSQLAdapter
-from app.models import UsageSnapshot
+from app.models import UsageSnapshot, UsageCounters
+
+
+USAGE_CHANGED_CHANNEL = "usage_snapshot_changed"
+NOTIFY_PAYLOAD_LIMIT = 7900
+
+COUNTER_COLUMNS = (
+    "uncached_input_tokens",
+    "cache_read_input_tokens",
+    "cache_creation_5m_tokens",
+    "cache_creation_1h_tokens",
+    "output_tokens",
+    "web_search_requests",
+)
+
+# Counters reported on a developer's stats page, and its periods as days back from today
+STATS_COLUMNS = (
+    "uncached_input_tokens",
+    "cache_read_input_tokens",
+    "output_tokens",
+    "web_search_requests",
+)
+STATS_PERIOD_DAYS = {"day": 1, "week": 7, "month": 30}
+
+PARTITION_PREFIX = "usage_snapshot_"
+
+# First days of the months whose usage_snapshot partition is known to exist
+_partition_months: Set[date] = set()
+
+
+def next_month(month: date) -> date:
+    return (month.replace(day=1) + timedelta(days=32)).replace(day=1)
 
 
 class UsageSnapshotRepository(PostgreSQLRepository):
@@ -19,54 +53,73 @@ class UsageSnapshotRepository(PostgreSQLRepository):
         )
         return UsageSnapshot.from_dict(results[0]) if results else None
 
-    def get_snapshots_for_period(self, start_date: date, end_date: date, model: Optional[str] = None) -> List[UsageSnapshot]:
+    def get_counters_for_period(self, start_date: date, end_date: date, model: Optional[str] = None) -> List[UsageCounters]:
+        """
+        The active snapshots in [start_date, end_date] (of one model if given),
+        selecting only UsageCounters' columns and decoding the cursor's tuples
+        directly, for aggregation.
+        """
+        values = [start_date, end_date]
+        model_filter = ""
         if model:
-            query = """
-                SELECT * FROM usage_snapshot
-                WHERE snapshot_date >= %s AND snapshot_date <= %s AND model = %s AND active = true
-            """
-            results = self._execute_within_context(
-                self.adapter.execute_query, query, (start_date, end_date, model)
-            )
-        else:
-            query = """
-                SELECT * FROM usage_snapshot
-                WHERE snapshot_date >= %s AND snapshot_date <= %s AND active = true
-            """
-            results = self._execute_within_context(
-                self.adapter.execute_query, query, (start_date, end_date)
-            )
-        return [UsageSnapshot.from_dict(row) for row in results] if results else []
+            model_filter = " AND model = %s"
+            values.append(model)
+        query = f"""
+            SELECT {", ".join(UsageCounters._fields)} FROM usage_snapshot
+            WHERE snapshot_date >= %s AND snapshot_date <= %s AND active = true{model_filter}
+        """
+        with self.adapter.transaction() as cursor:
+            cursor.execute(query, tuple(values))
+            return list(map(UsageCounters._make, cursor.fetchall()))
+
+    def get_developer_stats(
+        self, api_key_id: str, days: int = 30, model: Optional[str] = None
+    ) -> Tuple[List[Dict], Dict[str, Dict[str, int]]]:
+        """
+        Return (daily, periods) for one developer in a single grouped query.
 
-    def get_developer_history(self, api_key_id: str, days: int = 30, model: Optional[str] = None) -> List[UsageSnapshot]:
+        `daily` has one row per day of the last `days` days (summed over
+        models, newest first) with `snapshot_date` and the STATS_COLUMNS
+        totals; `periods` has the STATS_COLUMNS totals per STATS_PERIOD_DAYS
+        period, taken from the grand-total row with FILTER.
+        """
         end_date = date.today()
         start_date = end_date - timedelta(days=days)
+        sums = [f"COALESCE(SUM({c}), 0) AS {c}" for c in STATS_COLUMNS]
+        period_sums = [
+            f"COALESCE(SUM({c}) FILTER (WHERE snapshot_date >= %s), 0) AS {period}_{c}"
+            for period in STATS_PERIOD_DAYS
+            for c in STATS_COLUMNS
+        ]
+        values = [end_date - timedelta(days=n) for n in STATS_PERIOD_DAYS.values() for _ in STATS_COLUMNS]
+        values += [api_key_id, start_date, end_date]
+        model_filter = ""
         if model:
-            query = """
-                SELECT * FROM usage_snapshot
-                WHERE api_key_id = %s AND snapshot_date >= %s AND snapshot_date <= %s AND model = %s AND active = true
-                ORDER BY snapshot_date DESC
-            """
-            results = self._execute_within_context(
-                self.adapter.execute_query, query, (api_key_id, start_date, end_date, model)
-            )
-        else:
-            query = """
-                SELECT * FROM usage_snapshot
-                WHERE api_key_id = %s AND snapshot_date >= %s AND snapshot_date <= %s AND active = true
-                ORDER BY snapshot_date DESC
-            """
-            results = self._execute_within_context(
-                self.adapter.execute_query, query, (api_key_id, start_date, end_date)
-            )
-        return [UsageSnapshot.from_dict(row) for row in results] if results else []
+            model_filter = " AND model = %s"
+            values.append(model)
 
-    def get_distinct_models(self) -> List[str]:
-        query = "SELECT DISTINCT model FROM usage_snapshot WHERE active = true ORDER BY model"
+        query = f"""
+            SELECT snapshot_date, GROUPING(snapshot_date) AS is_total, {", ".join(sums + period_sums)}
+            FROM usage_snapshot
+            WHERE api_key_id = %s AND snapshot_date >= %s AND snapshot_date <= %s AND active = true{model_filter}
+            GROUP BY GROUPING SETS ((snapshot_date), ())
+            ORDER BY is_total, snapshot_date DESC
+        """
         results = self._execute_within_context(
-            self.adapter.execute_query, query, ()
-        )
-        return [row["model"] for row in results] if results else []
+            self.adapter.execute_query, query, tuple(values)
+        ) or []
+
+        daily = [
+            {"snapshot_date": row["snapshot_date"], **{c: int(row[c]) for c in STATS_COLUMNS}}
+            for row in results if not row["is_total"]
+        ]
+        # The empty grouping set always yields the total row, even without any usage
+        total = next(row for row in results if row["is_total"]) if results else {}
+        periods = {
+            period: {c: int(total.get(f"{period}_{c}", 0)) for c in STATS_COLUMNS}
+            for period in STATS_PERIOD_DAYS
+        }
+        return daily, periods
 
     def upsert_snapshot(self, snapshot: UsageSnapshot) -> UsageSnapshot:
         existing = self.get_by_api_key_date_model(snapshot.api_key_id, snapshot.snapshot_date, snapshot.model)
@@ -80,3 +133,162 @@ class UsageSnapshotRepository(PostgreSQLRepository):
             existing.fetched_at = snapshot.fetched_at
             return self.save(existing)
         return self.save(snapshot)
+
+    def bulk_upsert_snapshots(self, snapshots: Iterable[UsageSnapshot]) -> List[Tuple[str, date, str]]:
+        """
+        Upsert a batch of snapshots in a single transaction.
+
+        Rows are matched on the (api_key_id, snapshot_date, model) unique index;
+        rows whose counters are unchanged are left untouched. model_catalog is
+        updated in the same statement. Returns the (api_key_id, snapshot_date,
+        model) keys that were inserted or updated.
+        """
+        # ON CONFLICT can't touch the same row twice in one statement, so the last value per key wins
+        rows = {}
+        for s in snapshots:
+            rows[(s.api_key_id, s.snapshot_date, s.model)] = (
+                uuid4().hex,
+                s.api_key_id,
+                s.snapshot_date,
+                s.model,
+                *(getattr(s, column) for column in COUNTER_COLUMNS),
+                s.fetched_at,
+            )
+        if not rows:
+            return []
+
+        months = {snapshot_date.replace(day=1) for _, snapshot_date, _ in rows}
+        if not months <= _partition_months:
+            self.ensure_partitions(min(months), max(months))
+
+        columns = f"entity_id, api_key_id, snapshot_date, model, {', '.join(COUNTER_COLUMNS)}, fetched_at"
+        # The upsert never changes entity_id, so a returned row still carrying the
+        # supplied one was inserted (partitioned tables can't return xmax for this);
+        # catalog rows are taken in model order so concurrent upserts lock them consistently
+        query = f"""
+            WITH input ({columns}) AS (
+                VALUES %s
+            ), upserted AS (
+                INSERT INTO usage_snapshot ({columns})
+                SELECT {columns} FROM input
+                ON CONFLICT (api_key_id, snapshot_date, model) DO UPDATE SET
+                    {", ".join(f"{c} = EXCLUDED.{c}" for c in COUNTER_COLUMNS)},
+                    fetched_at = EXCLUDED.fetched_at
+                WHERE ({", ".join(f"usage_snapshot.{c}" for c in COUNTER_COLUMNS)})
+                    IS DISTINCT FROM ({", ".join(f"EXCLUDED.{c}" for c in COUNTER_COLUMNS)})
+                RETURNING entity_id, api_key_id, snapshot_date, model
+            ), written AS (
+                SELECT upserted.api_key_id, upserted.snapshot_date, upserted.model,
+                       upserted.entity_id = input.entity_id AS inserted
+                FROM upserted JOIN input USING (api_key_id, snapshot_date, model)
+            ), catalogued AS (
+                INSERT INTO model_catalog AS catalog (model, first_seen, last_seen, snapshot_count)
+                SELECT model, MIN(snapshot_date), MAX(snapshot_date), COUNT(*) FILTER (WHERE inserted)
+                FROM written
+                GROUP BY model
+                ORDER BY model
+                ON CONFLICT (model) DO UPDATE SET
+                    first_seen = LEAST(catalog.first_seen, EXCLUDED.first_seen),
+                    last_seen = GREATEST(catalog.last_seen, EXCLUDED.last_seen),
+                    snapshot_count = catalog.snapshot_count + EXCLUDED.snapshot_count
+            )
+            SELECT api_key_id, snapshot_date, model FROM written
+        """
+        with self.adapter.transaction() as cursor:
+            written = execute_values(cursor, query, list(rows.values()), page_size=1000, fetch=True)
+        return written
+
+    def ensure_partitions(self, start_date: date, end_date: date) -> int:
+        """Create any missing monthly partitions covering [start_date, end_date]; returns how many were created."""
+        with self.adapter.transaction() as cursor:
+            cursor.execute("SELECT ensure_usage_snapshot_partitions(%s, %s)", (start_date, end_date))
+            created = cursor.fetchone()[0]
+        month = start_date.replace(day=1)
+        while month <= end_date:
+            _partition_months.add(month)
+            month = next_month(month)
+        return created
+
+    def get_partition_months(self) -> List[date]:
+        """First day of each month that has a partition, oldest first."""
+        with self.adapter:
+            results = self.adapter.execute_query(
+                """
+                SELECT child.relname AS partition FROM pg_inherits
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE pg_inherits.inhparent = 'usage_snapshot'::regclass
+                """,
+                (),
+            )
+        return sorted(
+            date(int(row["partition"][-7:-3]), int(row["partition"][-2:]), 1)
+            for row in results or []
+            if row["partition"].startswith(PARTITION_PREFIX)
+        )
+
+    def has_daily_rows(self, month: date) -> bool:
+        """Whether the month has rows not yet compacted onto its first day."""
+        with self.adapter:
+            results = self.adapter.execute_query(
+                """
+                SELECT EXISTS (
+                    SELECT 1 FROM usage_snapshot
+                    WHERE snapshot_date > %s AND snapshot_date < %s AND active = true
+                ) AS has_daily
+                """,
+                (month, next_month(month)),
+            )
+        return bool(results and results[0]["has_daily"])
+
+    def compact_month(self, month: date) -> int:
+        """
+        Replace the month's daily rows with one row per (api_key_id, model)
+        dated on the month's first day, keeping model_catalog's row counts in
+        step, in one transaction. Returns the number of rows removed.
+        """
+        counters = ", ".join(COUNTER_COLUMNS)
+        with self.adapter.transaction() as cursor:
+            # Each model loses its rows and gains one per developer
+            cursor.execute(
+                f"""
+                WITH removed AS (
+                    DELETE FROM usage_snapshot
+                    WHERE snapshot_date >= %s AND snapshot_date < %s AND active = true
+                    RETURNING api_key_id, model, {counters}, fetched_at
+                ), catalogued AS (
+                    UPDATE model_catalog SET
+                        snapshot_count = snapshot_count - merged.count,
+                        first_seen = LEAST(first_seen, %s)
+                    FROM (
+                        SELECT model, COUNT(*) - COUNT(DISTINCT api_key_id) AS count FROM removed GROUP BY model
+                    ) merged
+                    WHERE model_catalog.model = merged.model
+                )
+                SELECT api_key_id, model, {", ".join(f"SUM({c})" for c in COUNTER_COLUMNS)}, MAX(fetched_at), COUNT(*)
+                FROM removed
+                GROUP BY api_key_id, model
+                """,
+                (month, next_month(month), month),
+            )
+            merged = cursor.fetchall()
+            execute_values(
+                cursor,
+                f"INSERT INTO usage_snapshot (entity_id, api_key_id, snapshot_date, model, {counters}, fetched_at) VALUES %s",
+                [(uuid4().hex, api_key_id, month, model, *sums) for api_key_id, model, *sums, _ in merged],
+                page_size=1000,
+            )
+        return sum(row[-1] for row in merged) - len(merged)
+
+    def notify_changes(self, dates: Iterable[date], models: Iterable[str]):
+        """
+        Publish a NOTIFY on USAGE_CHANGED_CHANNEL so every worker can refresh
+        its caches. Payloads are limited to 8000 bytes, so when the dates
+        (e.g. of a long backfill) don't fit, "dates" is null: any date may
+        have changed.
+        """
+        models = sorted(set(models))
+        payload = json.dumps({"dates": sorted({d.isoformat() for d in dates}), "models": models})
+        if len(payload) > NOTIFY_PAYLOAD_LIMIT:
+            payload = json.dumps({"dates": None, "models": models})
+        with self.adapter:
+            self.adapter.run_transaction([("SELECT pg_notify(%s, %s)", (USAGE_CHANGED_CHANNEL, payload))])
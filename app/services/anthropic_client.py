@@ -1,17 +1,52 @@
 import httpx
 import asyncio
-from datetime import datetime, date
-from typing import List, Dict, Any, Optional
+import random
+import time
+from datetime import datetime, date, timezone
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Iterable, List, Dict, Any, Optional
 import logging
 
+from app.config import get_settings
+
 logger = logging.getLogger(__name__)
 
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504, 529}
+
+
+class UsageReportError(Exception):
+    """A usage report page that still failed after retries."""
+
 
 class AnthropicAdminClient:
+    """
+    Admin API client meant to be shared process-wide (see get_admin_client).
+
+    Requests go over one HTTP/2 keep-alive connection pool. Retryable failures
+    (429, 5xx, transport errors) are retried with jittered exponential backoff,
+    honoring Retry-After. Instead of a fixed delay between pages, requests are
+    paced from the rate-limit headers: the remaining request budget is spread
+    over the time until it resets, and a 429 pauses every caller sharing the
+    client.
+    """
+
     BASE_URL = "https://api.anthropic.com/v1"
 
-    def __init__(self, admin_api_key: str):
+    def __init__(
+        self,
+        admin_api_key: str,
+        max_retries: int = 5,
+        backoff_base_seconds: float = 1.0,
+        backoff_max_seconds: float = 60.0,
+        keys_per_request: int = 100,
+        parallel_requests: int = 4,
+    ):
         self.admin_api_key = admin_api_key
+        self.keys_per_request = keys_per_request
+        self.parallel_requests = parallel_requests
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
         self.client = httpx.AsyncClient(
             headers={
                 "x-api-key": admin_api_key,
@@ -19,15 +54,27 @@ class AnthropicAdminClient:
                 "Content-Type": "application/json",
             },
             timeout=30.0,
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=10, keepalive_expiry=120.0),
         )
+        # time.monotonic() before which no request may start
+        self._next_request_at = 0.0
 
-    async def get_usage_report(
+    async def iter_usage_report(
         self,
         starting_at: datetime,
         ending_at: datetime,
         group_by: List[str] = None,
         bucket_width: str = "1d",
-    ) -> Optional[List[Dict[str, Any]]]:
+        api_key_ids: Optional[List[str]] = None,
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield the usage report one page of buckets at a time, as each page
+        arrives. Each bucket has `starting_at` and the API's `results`.
+        If api_key_ids is given, the API only reports those keys.
+        Raises UsageReportError if a page still fails after retries; the
+        pages yielded before it are unaffected.
+        """
         if group_by is None:
             group_by = ["api_key_id"]
 
@@ -41,53 +88,187 @@ class AnthropicAdminClient:
         # API requires group_by[] for array parameters
         for gb in group_by:
             params.append(("group_by[]", gb))
+        for api_key_id in api_key_ids or []:
+            params.append(("api_key_ids[]", api_key_id))
+
+        page_count = 0
+        next_page = None
+
+        while True:
+            page_params = list(params)
+            if next_page:
+                page_params.append(("page", next_page))
+
+            try:
+                data = await self._get(url, page_params)
+            except httpx.HTTPStatusError as e:
+                message = f"HTTP error fetching usage report page {page_count + 1}: {e.response.status_code} - {e.response.text}"
+                logger.error(message)
+                raise UsageReportError(message) from e
+            except (httpx.HTTPError, ValueError) as e:
+                message = f"Error fetching usage report page {page_count + 1}: {e}"
+                logger.error(message)
+                raise UsageReportError(message) from e
+
+            buckets = data.get("data", [])
+            page_count += 1
+            logger.info(f"Page {page_count}: {len(buckets)} buckets")
+            yield buckets
+
+            # Check for more pages
+            if not data.get("has_more", False):
+                break
+            next_page = data.get("next_page")
+            if not next_page:
+                break
+
+        logger.info(f"Total: {page_count} pages")
+
+    async def iter_usage_report_for_keys(
+        self,
+        starting_at: datetime,
+        ending_at: datetime,
+        api_key_ids: Iterable[str],
+        group_by: List[str] = None,
+        bucket_width: str = "1d",
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Like iter_usage_report filtered to api_key_ids, but large key sets are
+        split into chunks of `keys_per_request` fetched by up to
+        `parallel_requests` concurrent report requests. Pages from different
+        chunks are interleaved; within a chunk they stay in time order. If any
+        chunk fails, the others are cancelled and UsageReportError is raised.
+        """
+        api_key_ids = sorted(set(api_key_ids))
+        size = self.keys_per_request
+        chunks = [api_key_ids[i:i + size] for i in range(0, len(api_key_ids), size)]
+        if len(chunks) <= 1:
+            async for page in self.iter_usage_report(starting_at, ending_at, group_by, bucket_width, api_key_ids):
+                yield page
+            return
+
+        # Bounded, so fast producers wait for the consumer instead of buffering the report
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.parallel_requests)
+        semaphore = asyncio.Semaphore(self.parallel_requests)
+        chunk_done = object()
+
+        async def produce(chunk: List[str]):
+            try:
+                async with semaphore:
+                    async for page in self.iter_usage_report(starting_at, ending_at, group_by, bucket_width, chunk):
+                        await queue.put(page)
+            except UsageReportError as e:
+                await queue.put(e)
+                return
+            await queue.put(chunk_done)
 
+        tasks = [asyncio.create_task(produce(chunk)) for chunk in chunks]
+        remaining = len(tasks)
         try:
-            all_results = []
-            page_count = 0
-            next_page = None
-
-            while True:
-                page_params = list(params)
-                if next_page:
-                    page_params.append(("page", next_page))
-
-                response = await self.client.get(url, params=page_params)
-                response.raise_for_status()
-                data = response.json()
-
-                buckets = data.get("data", [])
-                page_count += 1
-                logger.info(f"Page {page_count}: {len(buckets)} buckets")
-
-                # Extract results from each bucket
-                for bucket in buckets:
-                    bucket_date = bucket.get("starting_at", "")[:10]  # Extract YYYY-MM-DD
-                    results = bucket.get("results", [])
-                    if results:
-                        logger.info(f"Bucket {bucket_date} has {len(results)} results")
-                    for result in results:
-                        result["_bucket_date"] = bucket_date
-                        all_results.append(result)
-
-                # Check for more pages
-                if not data.get("has_more", False):
-                    break
-                next_page = data.get("next_page")
-                if not next_page:
-                    break
-
-                # Delay between pagination requests to avoid rate limits
-                await asyncio.sleep(1.0)
-
-            logger.info(f"Total: {page_count} pages, {len(all_results)} results")
-            return all_results
-        except httpx.HTTPStatusError as e:
-            logger.error(f"HTTP error fetching usage report: {e.response.status_code} - {e.response.text}")
-            return None
-        except Exception as e:
-            logger.error(f"Error fetching usage report: {e}")
+            while remaining:
+                item = await queue.get()
+                if item is chunk_done:
+                    remaining -= 1
+                elif isinstance(item, UsageReportError):
+                    raise item
+                else:
+                    yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _get(self, url: str, params: list) -> Dict[str, Any]:
+        """GET with pacing and retries; raises the last error once retries are exhausted."""
+        attempt = 0
+        while True:
+            await self._pace()
+            try:
+                response = await self.client.get(url, params=params)
+            except httpx.TransportError as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"Usage report request failed ({e!r}), retrying in {delay:.1f}s")
+            else:
+                self._update_pacing(response)
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= self.max_retries:
+                    response.raise_for_status()
+                    return response.json()
+                retry_after = self._retry_after(response)
+                delay = retry_after if retry_after is not None else self._backoff(attempt)
+                if response.status_code == 429:
+                    # Everyone sharing this client is over the same limit
+                    self._next_request_at = max(self._next_request_at, time.monotonic() + delay)
+                logger.warning(f"Usage report request got {response.status_code}, retrying in {delay:.1f}s")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _pace(self):
+        delay = self._next_request_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter."""
+        return random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** attempt))
+
+    def _update_pacing(self, response: httpx.Response):
+        remaining = response.headers.get("anthropic-ratelimit-requests-remaining")
+        reset = response.headers.get("anthropic-ratelimit-requests-reset")
+        if remaining is None or reset is None:
+            return
+        try:
+            remaining = int(remaining)
+            reset_in = (
+                datetime.fromisoformat(reset.replace("Z", "+00:00")) - datetime.now(timezone.utc)
+            ).total_seconds()
+        except ValueError:
+            return
+        if reset_in <= 0:
+            return
+        # Spread what is left of the budget evenly until it refills
+        spacing = min(reset_in / max(remaining, 1), self.backoff_max_seconds)
+        self._next_request_at = max(self._next_request_at, time.monotonic() + spacing)
+
+    def _retry_after(self, response: httpx.Response) -> Optional[float]:
+        value = response.headers.get("retry-after")
+        if value is None:
             return None
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                return None
+        return min(max(seconds, 0.0), self.backoff_max_seconds)
 
     async def close(self):
         await self.client.aclose()
+
+
+_admin_client: Optional[AnthropicAdminClient] = None
+
+
+def get_admin_client() -> AnthropicAdminClient:
+    """Return the process-wide Admin API client, creating it on first use."""
+    global _admin_client
+    if _admin_client is None:
+        settings = get_settings()
+        _admin_client = AnthropicAdminClient(
+            settings.anthropic_admin_api_key,
+            max_retries=settings.anthropic_max_retries,
+            backoff_base_seconds=settings.anthropic_backoff_base_seconds,
+            backoff_max_seconds=settings.anthropic_backoff_max_seconds,
+            keys_per_request=settings.usage_report_keys_per_request,
+            parallel_requests=settings.usage_report_parallel_requests,
+        )
+    return _admin_client
+
+
+async def close_admin_client():
+    global _admin_client
+    if _admin_client is not None:
+        await _admin_client.close()
+        _admin_client = None
@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional, Set, Tuple
+
+from app.config import get_settings
+from app.database import create_adapter, run_in_db_executor
+from app.repositories import BackfillCheckpointRepository, DeveloperRepository
+from app.services.anthropic_client import get_admin_client
+from app.services.scheduler import SnapshotKey, ingest_daily_report, publish_snapshots
+from app.services.snapshot_maintenance import compaction_cutoff
+
+logger = logging.getLogger(__name__)
+
+Window = Tuple[date, date]
+
+
+class RateBudget:
+    """Token bucket limiting how many report requests may start per minute."""
+
+    def __init__(self, requests_per_minute: int):
+        self.capacity = max(1, requests_per_minute)
+        self._tokens = float(self.capacity)
+        self._rate = self.capacity / 60.0
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+def split_windows(start_date: date, end_date: date, window_days: int) -> List[Window]:
+    """
+    Split [start_date, end_date] into inclusive windows of window_days.
+
+    Windows are aligned to fixed boundaries (multiples of window_days since
+    date.min) rather than to start_date, so overlapping backfills and
+    re-runs with a slightly different range share checkpoints.
+    """
+    windows = []
+    aligned = date.fromordinal(start_date.toordinal() - (start_date.toordinal() - 1) % window_days)
+    while aligned <= end_date:
+        window_end = aligned + timedelta(days=window_days - 1)
+        windows.append((max(aligned, start_date), min(window_end, end_date)))
+        aligned = window_end + timedelta(days=1)
+    return windows
+
+
+def default_backfill_range(today: Optional[date] = None) -> Window:
+    """The month leaderboard's window up to yesterday; today is covered by the incremental fetch."""
+    today = today or datetime.utcnow().date()
+    return today - timedelta(days=get_settings().backfill_days), today - timedelta(days=1)
+
+
+async def run_backfill(
+    start_date: date,
+    end_date: date,
+    api_key_ids: Optional[Iterable[str]] = None,
+    job_name: Optional[str] = None,
+    per_key_jobs: bool = False,
+    window_days: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    requests_per_minute: Optional[int] = None,
+) -> int:
+    """
+    Fetch daily usage for [start_date, end_date] and store it for the given
+    API keys (default: every registered developer).
+
+    The range is split into windows that are fetched concurrently, bounded by
+    `concurrency` in flight and `requests_per_minute` started. Each stored
+    window is checkpointed under job_name, and windows already checkpointed
+    are skipped, so a crashed backfill resumes where it stopped. With
+    per_key_jobs, windows are checkpointed under each key's own job
+    (key_job_name) instead and skipped only once every key has them, so a
+    batch of keys can be resumed by any subset of them. Rollups are
+    refreshed and other workers notified once, after every window finished.
+    Returns the number of snapshots written.
+    """
+    settings = get_settings()
+    if not settings.anthropic_admin_api_key:
+        logger.warning("No Anthropic Admin API key configured, skipping backfill")
+        return 0
+
+    # Compacted months hold monthly rows; daily rows stored there would be counted twice
+    cutoff = compaction_cutoff()
+    if cutoff is not None and start_date < cutoff:
+        logger.warning(f"Backfill before {cutoff} would re-add compacted days, starting from {cutoff}")
+        start_date = cutoff
+    if start_date > end_date:
+        return 0
+
+    window_days = window_days or settings.backfill_window_days
+    concurrency = concurrency or settings.backfill_concurrency
+    requests_per_minute = requests_per_minute or settings.backfill_requests_per_minute
+
+    adapter = create_adapter()
+    checkpoint_repo = BackfillCheckpointRepository(adapter)
+
+    if api_key_ids is None:
+        api_key_ids = await run_in_db_executor(DeveloperRepository(adapter).get_all_api_key_ids)
+    api_key_ids: Set[str] = set(api_key_ids)
+    if not api_key_ids:
+        logger.info("No API keys to backfill")
+        return 0
+
+    if per_key_jobs:
+        job_names = [key_job_name(api_key_id) for api_key_id in sorted(api_key_ids)]
+        job_name = job_names[0] if len(job_names) == 1 else f"{len(job_names)} keys"
+    else:
+        job_name = job_name or "all"
+        job_names = [job_name]
+    completed = await run_in_db_executor(checkpoint_repo.get_completed_windows, job_names)
+    pending = [w for w in split_windows(start_date, end_date, window_days) if w not in completed]
+    if not pending:
+        logger.info(f"Backfill '{job_name}' for {start_date}..{end_date} already complete")
+        return 0
+
+    logger.info(
+        f"Backfill '{job_name}': {len(pending)} windows for {start_date}..{end_date}, "
+        f"{len(api_key_ids)} keys, concurrency {concurrency}, {requests_per_minute} req/min"
+    )
+
+    client = get_admin_client()
+    semaphore = asyncio.Semaphore(concurrency)
+    budget = RateBudget(requests_per_minute)
+    # Rollups and caches are refreshed once for the whole backfill, not per window
+    written_keys: Set[SnapshotKey] = set()
+
+    async def backfill_window(window: Window) -> int:
+        window_start, window_end = window
+        # Windows are stored concurrently, and an adapter must not be shared across threads
+        window_adapter = create_adapter()
+        async with semaphore:
+            await budget.acquire()
+            pages = client.iter_usage_report_for_keys(
+                starting_at=datetime.combine(window_start, datetime.min.time()),
+                ending_at=datetime.combine(window_end + timedelta(days=1), datetime.min.time()),
+                api_key_ids=api_key_ids,
+                group_by=["api_key_id", "model"],
+                bucket_width="1d",
+            )
+            # A failed page raises after the days received so far are stored,
+            # leaving the window unchecked so a re-run fetches it again
+            written = await ingest_daily_report(window_adapter, pages, api_key_ids, deferred=written_keys)
+        await run_in_db_executor(
+            BackfillCheckpointRepository(window_adapter).mark_completed, job_names, window_start, window_end, written
+        )
+        logger.info(f"Backfill '{job_name}' window {window_start}..{window_end}: {written} snapshots")
+        return written
+
+    results = await asyncio.gather(*(backfill_window(w) for w in pending), return_exceptions=True)
+    if written_keys:
+        await run_in_db_executor(publish_snapshots, adapter, written_keys)
+
+    failures = [r for r in results if isinstance(r, Exception)]
+    for failure in failures:
+        logger.error(f"Backfill '{job_name}' window failed: {failure}")
+    written = sum(r for r in results if not isinstance(r, Exception))
+    logger.info(
+        f"Backfill '{job_name}' finished: {len(pending) - len(failures)}/{len(pending)} windows, "
+        f"{written} snapshots written"
+    )
+    return written
+
+
+def key_job_name(api_key_id: str) -> str:
+    """The checkpoint job of one key's own backfill (see run_backfill's per_key_jobs)."""
+    return f"key:{api_key_id}"
+
+
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def schedule_backfill(**kwargs) -> asyncio.Task:
+    """Run run_backfill in the background over the default range unless start/end are given."""
+    if "start_date" not in kwargs:
+        kwargs["start_date"], kwargs["end_date"] = default_backfill_range()
+    task = asyncio.create_task(run_backfill(**kwargs))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def cancel_backfills():
+    for task in list(_background_tasks):
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
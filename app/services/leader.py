@@ -0,0 +1,109 @@
+import logging
+import os
+import socket
+import threading
+from typing import Optional
+
+import psycopg2
+from psycopg2 import extensions
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderElection:
+    """
+    Elects one process across all workers and replicas to run the fetch job.
+
+    Leadership is a session-level Postgres advisory lock held on a dedicated
+    connection, so it is released by the server as soon as the leader's process
+    or connection dies. Followers retry on every scheduler tick, which bounds
+    failover to one fetch interval.
+    """
+
+    def __init__(self, lock_key: int):
+        self.lock_key = lock_key
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.is_leader = False
+        self.leader_id: Optional[str] = None
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        """Return whether this process is (still) the leader. Blocking; run it on the DB executor."""
+        with self._lock:
+            try:
+                if self._conn is None or self._conn.closed:
+                    # A fresh session holds no lock, whatever we believed before
+                    self.is_leader = False
+                    self._connect()
+                with self._conn.cursor() as cursor:
+                    if self.is_leader:
+                        # Liveness probe: the lock lives exactly as long as this session
+                        cursor.execute("SELECT 1")
+                    else:
+                        cursor.execute("SELECT pg_try_advisory_lock(%s)", (self.lock_key,))
+                        if cursor.fetchone()[0]:
+                            self.is_leader = True
+                            logger.info(f"{self.instance_id} acquired scheduler leadership")
+                    self.leader_id = self._current_leader(cursor)
+            except psycopg2.Error as e:
+                if self.is_leader:
+                    logger.warning(f"{self.instance_id} lost scheduler leadership: {e}")
+                self.is_leader = False
+                self.leader_id = None
+                self._close()
+            return self.is_leader
+
+    def release(self):
+        with self._lock:
+            if self.is_leader and self._conn is not None and not self._conn.closed:
+                try:
+                    with self._conn.cursor() as cursor:
+                        cursor.execute("SELECT pg_advisory_unlock(%s)", (self.lock_key,))
+                    logger.info(f"{self.instance_id} released scheduler leadership")
+                except psycopg2.Error:
+                    pass
+            self.is_leader = False
+            self._close()
+
+    def _connect(self):
+        settings = get_settings()
+        self._conn = psycopg2.connect(
+            host=settings.database_host,
+            port=settings.database_port,
+            user=settings.database_user,
+            password=settings.database_password,
+            database=settings.database_name,
+            application_name=f"baroque-scheduler {self.instance_id}"[:63],
+        )
+        self._conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+
+    def _current_leader(self, cursor) -> Optional[str]:
+        if self.is_leader:
+            return self.instance_id
+        cursor.execute(
+            """
+            SELECT a.application_name FROM pg_locks l
+            JOIN pg_stat_activity a ON a.pid = l.pid
+            WHERE l.locktype = 'advisory' AND l.granted
+              AND l.classid = ((%s::bigint >> 32) & 4294967295)::oid
+              AND l.objid = (%s::bigint & 4294967295)::oid
+            LIMIT 1
+            """,
+            (self.lock_key, self.lock_key),
+        )
+        row = cursor.fetchone()
+        return row[0].removeprefix("baroque-scheduler ") if row else None
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except psycopg2.Error:
+                pass
+            self._conn = None
+
+
+leader_election = LeaderElection(lock_key=get_settings().scheduler_lock_key)
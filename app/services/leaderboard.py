@@ -1,8 +1,23 @@
-from typing import Dict, List, Optional
-from datetime import date, timedelta
+import functools
+import itertools
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from datetime import date, datetime, timedelta
 from collections import defaultdict
-from app.models import UsageSnapshot, Developer
-from app.repositories import UsageSnapshotRepository, DeveloperRepository
+from app.config import get_settings
+from app.database import create_adapter, run_in_db_executor
+from app.models import UsageSnapshot, UsageCounters, Developer
+from app.repositories import (
+    UsageSnapshotRepository,
+    DeveloperRepository,
+    UsageRollupRepository,
+    UsageCumulativeRepository,
+)
+from app.repositories.rollup_repo import percentage
+from app.services import leaderboard_numpy
+from app.services.leaderboard_cache import leaderboard_cache
+from app.services.single_flight import SingleFlight
+
+PERIODS = ("day", "week", "month")
 
 
 def mask_api_key(api_key_id: str) -> str:
@@ -12,13 +27,20 @@ def mask_api_key(api_key_id: str) -> str:
 
 
 def calculate_cache_rate(cache_read: int, uncached_input: int) -> float:
-    total_input = cache_read + uncached_input
-    if total_input == 0:
-        return 0.0
-    return round((cache_read / total_input) * 100, 2)
+    return percentage(cache_read, cache_read + uncached_input)
+
+
+def get_period_window(period: str, today: Optional[date] = None) -> Tuple[date, date]:
+    today = today or date.today()
+    if period == "day":
+        return today, today
+    elif period == "week":
+        return today - timedelta(days=7), today
+    else:  # month
+        return today - timedelta(days=30), today
 
 
-def aggregate_snapshots(snapshots: List[UsageSnapshot]) -> Dict[str, Dict]:
+def aggregate_snapshots(snapshots: Iterable[Union[UsageSnapshot, UsageCounters]]) -> Dict[str, Dict]:
     aggregated = defaultdict(lambda: {
         "uncached_input_tokens": 0,
         "cache_read_input_tokens": 0,
@@ -40,27 +62,50 @@ def aggregate_snapshots(snapshots: List[UsageSnapshot]) -> Dict[str, Dict]:
     return aggregated
 
 
-def calculate_leaderboard(
-    usage_repo: UsageSnapshotRepository,
-    dev_repo: DeveloperRepository,
-    period: str,
-    current_user_api_key_id: Optional[str] = None,
-    model: Optional[str] = None,
-) -> Dict[str, List[Dict]]:
-    today = date.today()
+class RankedLeaderboard:
+    """
+    Every developer's entry per category, sorted by rank, plus each
+    api_key_id's position in every category so single rows and rank
+    neighbourhoods are sliced out without scanning. Entries carry the full,
+    unmasked api_key_id. `updated_at` is when the underlying usage last
+    changed. Immutable once built, so it is shared through the cache;
+    `version` is unique per build and keys anything derived from it.
+    """
 
-    if period == "day":
-        start_date = today
-    elif period == "week":
-        start_date = today - timedelta(days=7)
-    else:  # month
-        start_date = today - timedelta(days=30)
+    _versions = itertools.count(1)
+
+    def __init__(self, categories: Dict[str, List[Dict]], updated_at: Optional[datetime] = None):
+        self.categories = categories
+        self.updated_at = updated_at or datetime.utcnow()
+        self.version = next(self._versions)
+        self.positions = {
+            category: {entry["api_key_id"]: i for i, entry in enumerate(entries)}
+            for category, entries in categories.items()
+        }
+
+    @property
+    def total(self) -> int:
+        return len(next(iter(self.categories.values()), []))
 
-    snapshots = usage_repo.get_snapshots_for_period(start_date, today, model=model)
-    aggregated = aggregate_snapshots(snapshots)
+    def page(self, category: str, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        entries = self.categories[category]
+        return entries[offset:] if limit is None else entries[offset:offset + limit]
 
-    developers = {dev.api_key_id: dev for dev in dev_repo.get_all_active()}
+    def around(self, category: str, api_key_id: str, limit: int) -> List[Dict]:
+        """Up to `limit` entries centred on api_key_id's rank; empty if it isn't ranked."""
+        position = self.positions[category].get(api_key_id)
+        if position is None:
+            return []
+        start = max(0, min(position - limit // 2, len(self.categories[category]) - limit))
+        return self.categories[category][start:start + limit]
 
+    def entry(self, category: str, api_key_id: str) -> Optional[Dict]:
+        position = self.positions[category].get(api_key_id)
+        return self.categories[category][position] if position is not None else None
+
+
+def rank_categories(aggregated: Dict[str, Dict], updated_at: Optional[datetime] = None) -> RankedLeaderboard:
+    """Score and rank every developer per category."""
     categories = {
         "efficient_user": [],
         "cache_champion": [],
@@ -70,36 +115,219 @@ def calculate_leaderboard(
 
     for api_key_id, data in aggregated.items():
         total_input = data["uncached_input_tokens"] + data["cache_read_input_tokens"]
-        efficiency = round((data["output_tokens"] / total_input) * 100, 2) if total_input > 0 else 0
+        efficiency = percentage(data["output_tokens"], total_input) if total_input > 0 else 0
         cache_rate = calculate_cache_rate(
             data["cache_read_input_tokens"],
             data["uncached_input_tokens"]
         )
 
-        dev = developers.get(api_key_id)
-        is_self = api_key_id == current_user_api_key_id
-        display_name = dev.name if (dev and is_self) else mask_api_key(api_key_id)
-
-        # Mask api_key_id for privacy - only show full ID to self
-        masked_api_key = api_key_id if is_self else mask_api_key(api_key_id)
-
-        base_entry = {
-            "api_key_id": masked_api_key,
-            "display_name": display_name,
-            "is_self": is_self,
-        }
-
-        categories["efficient_user"].append({**base_entry, "value": efficiency})
-        categories["cache_champion"].append({**base_entry, "value": cache_rate})
-        categories["wordsmith"].append({**base_entry, "value": data["output_tokens"]})
-        categories["tool_master"].append({**base_entry, "value": data["web_search_requests"]})
+        categories["efficient_user"].append({"api_key_id": api_key_id, "value": efficiency})
+        categories["cache_champion"].append({"api_key_id": api_key_id, "value": cache_rate})
+        categories["wordsmith"].append({"api_key_id": api_key_id, "value": data["output_tokens"]})
+        categories["tool_master"].append({"api_key_id": api_key_id, "value": data["web_search_requests"]})
 
+    # Standard competition ranking: equal scores share a rank (1, 2, 2, 4)
     for category in categories:
         categories[category].sort(key=lambda x: x["value"], reverse=True)
-        for rank, entry in enumerate(categories[category], 1):
+        previous = None
+        for position, entry in enumerate(categories[category], 1):
+            if previous is None or entry["value"] != previous["value"]:
+                rank = position
             entry["rank"] = rank
+            previous = entry
+
+    return RankedLeaderboard(categories, updated_at)
+
+
+def get_ranked_categories(
+    usage_repo: UsageSnapshotRepository,
+    period: str,
+    model: Optional[str] = None,
+    rollup_repo: Optional[UsageRollupRepository] = None,
+) -> RankedLeaderboard:
+    """Return the ranked leaderboard for (period, model), served from the cache when possible."""
+    window = get_period_window(period)
+
+    ranked = leaderboard_cache.get(period, model, window)
+    if ranked is not None:
+        return ranked
+
+    generation = leaderboard_cache.generation
+    start_date, end_date = window
+
+    # Pre-summed rollups are only valid for today's window; otherwise re-sum the raw snapshots
+    aggregated = rollup_repo.get_period_totals(period, window, model=model) if rollup_repo else None
+    if aggregated is not None:
+        ranked = rank_categories(aggregated, rollup_repo.get_computed_at(period))
+    else:
+        counters = usage_repo.get_counters_for_period(start_date, end_date, model=model)
+        if leaderboard_numpy.enabled():
+            ranked = RankedLeaderboard(leaderboard_numpy.rank_columns(leaderboard_numpy.UsageColumns(counters)))
+        else:
+            ranked = rank_categories(aggregate_snapshots(counters))
+
+    leaderboard_cache.put(period, model, window, ranked, generation)
+    return ranked
+
+
+def compute_ranked(period: str, model: Optional[str]) -> RankedLeaderboard:
+    """get_ranked_categories on a fresh adapter. Blocking; run it on the DB executor."""
+    adapter = create_adapter()
+    return get_ranked_categories(
+        UsageSnapshotRepository(adapter), period, model=model, rollup_repo=UsageRollupRepository(adapter)
+    )
+
+
+def materialize_leaderboards() -> int:
+    """
+    Rank the unfiltered and every per-model leaderboard of all periods from
+    one read of the rollups, and publish them to the cache in one step.
+    Models beyond the cache's capacity are left to be computed on demand,
+    keeping the ones with the most developers. Returns the number of
+    leaderboards published (0 if usage changed meanwhile). Blocking; run it
+    on the DB executor.
+    """
+    generation = leaderboard_cache.generation
+    windows = {period: get_period_window(period) for period in PERIODS}
+    totals = UsageRollupRepository(create_adapter()).get_all_period_totals(windows)
 
-    return categories
+    developers = defaultdict(int)
+    for _, models in totals.values():
+        for model, aggregated in models.items():
+            developers[model] = max(developers[model], len(aggregated))
+    per_model = sorted((m for m in developers if m is not None), key=lambda m: -developers[m])
+    kept = {None, *per_model[:leaderboard_cache.max_models - 1]}
+
+    boards = {}
+    for period, (computed_at, models) in totals.items():
+        for model in kept:
+            boards[(period, model)] = (windows[period], rank_categories(models.get(model, {}), computed_at))
+    return len(boards) if leaderboard_cache.put_many(boards, generation) else 0
+
+
+ranked_flights = SingleFlight("leaderboard")
+
+
+async def load_ranked(period: str, model: Optional[str] = None, stale_ok: bool = True) -> RankedLeaderboard:
+    """
+    Return the ranked leaderboard for (period, model) from async code.
+
+    Concurrent misses share one computation. With `stale_ok` (and
+    LEADERBOARD_STALE_WHILE_REVALIDATE on), a leaderboard invalidated by new
+    usage is served as-is while one background computation replaces it.
+    """
+    window = get_period_window(period)
+    ranked = leaderboard_cache.get(period, model, window)
+    if ranked is not None:
+        return ranked
+
+    key = (period, model, window, leaderboard_cache.generation)
+    factory = functools.partial(run_in_db_executor, compute_ranked, period, model)
+    if stale_ok and get_settings().leaderboard_stale_while_revalidate:
+        stale = leaderboard_cache.get_stale(period, model, window)
+        if stale is not None:
+            ranked_flights.start(key, factory)
+            return stale
+    return await ranked_flights.do(key, factory)
+
+
+def compute_ranked_range(start_date: date, end_date: date, model: Optional[str]) -> RankedLeaderboard:
+    """
+    Rank [start_date, end_date] from the running totals in usage_cumulative,
+    at two index lookups per developer whatever the range's length. Blocking;
+    run it on the DB executor.
+    """
+    computed_at, aggregated = UsageCumulativeRepository(create_adapter()).get_range_totals(start_date, end_date, model)
+    return rank_categories(aggregated, computed_at)
+
+
+async def load_ranked_range(start_date: date, end_date: date, model: Optional[str] = None) -> RankedLeaderboard:
+    """
+    Return the ranked leaderboard for an arbitrary date range from async code.
+    Not cached, as ranges are open-ended; concurrent requests for the same
+    range share one computation until usage changes.
+    """
+    key = ("range", start_date, end_date, model, leaderboard_cache.generation)
+    return await ranked_flights.do(
+        key, functools.partial(run_in_db_executor, compute_ranked_range, start_date, end_date, model)
+    )
+
+
+def present_categories(
+    categories: Dict[str, List[Dict]],
+    dev_repo: DeveloperRepository,
+    current_user_api_key_id: Optional[str] = None,
+) -> Dict[str, List[Dict]]:
+    """Mask the selected ranked entries for display, unmasking only the current user's own row."""
+    current_user_name = None
+    if current_user_api_key_id and any(
+        any(entry["api_key_id"] == current_user_api_key_id for entry in entries) for entries in categories.values()
+    ):
+        dev = dev_repo.get_by_api_key_id(current_user_api_key_id)
+        current_user_name = dev.name if dev else None
+
+    presented_categories = {}
+    for category, entries in categories.items():
+        presented = []
+        for entry in entries:
+            api_key_id = entry["api_key_id"]
+            is_self = api_key_id == current_user_api_key_id
+            masked = mask_api_key(api_key_id)
+
+            # Mask api_key_id for privacy - only show full ID to self
+            presented.append({
+                "api_key_id": api_key_id if is_self else masked,
+                "display_name": current_user_name if (is_self and current_user_name) else masked,
+                "is_self": is_self,
+                "value": entry["value"],
+                "rank": entry["rank"],
+            })
+        presented_categories[category] = presented
+
+    return presented_categories
+
+
+def calculate_leaderboard(
+    usage_repo: UsageSnapshotRepository,
+    dev_repo: DeveloperRepository,
+    period: str,
+    current_user_api_key_id: Optional[str] = None,
+    model: Optional[str] = None,
+    rollup_repo: Optional[UsageRollupRepository] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    around: Optional[str] = None,
+    ranked: Optional[RankedLeaderboard] = None,
+) -> Dict:
+    """
+    Return {"categories": ..., "total": ..., "updated_at": ..., "api_key_ids": ...}
+    for one page of the leaderboard; api_key_ids are the (unmasked) keys
+    with an entry on the page.
+
+    By default every entry is returned; `limit`/`offset` select a page, and
+    `around` selects the `limit` entries centred on that api_key_id instead.
+    Only the selected entries are copied and masked. Pass `ranked` to page
+    a leaderboard already loaded (see load_ranked).
+    """
+    if ranked is None:
+        ranked = get_ranked_categories(usage_repo, period, model=model, rollup_repo=rollup_repo)
+    if around is not None:
+        selected = {category: ranked.around(category, around, limit or 10) for category in ranked.categories}
+    else:
+        selected = {category: ranked.page(category, limit, offset) for category in ranked.categories}
+    return {
+        "categories": present_categories(selected, dev_repo, current_user_api_key_id),
+        "total": ranked.total,
+        "updated_at": ranked.updated_at,
+        "api_key_ids": {entry["api_key_id"] for entries in selected.values() for entry in entries},
+    }
+
+
+def rank_percentile(rank: int, total: int) -> float:
+    """Share of developers ranked at or below `rank`, in percent; 0 when unranked."""
+    if rank == 0 or total == 0:
+        return 0.0
+    return round((total - rank + 1) / total * 100, 2)
 
 
 def get_developer_rankings(
@@ -108,17 +336,35 @@ def get_developer_rankings(
     api_key_id: str,
     period: str = "week",
     model: Optional[str] = None,
-) -> Dict[str, int]:
-    # Pass api_key_id as current_user so their entry won't be masked
-    leaderboard = calculate_leaderboard(usage_repo, dev_repo, period, current_user_api_key_id=api_key_id, model=model)
-    rankings = {}
+    rollup_repo: Optional[UsageRollupRepository] = None,
+) -> Dict[str, Dict]:
+    """
+    Return {category: {"rank", "percentile"}} for one developer (rank 0 when
+    unranked).
 
-    for category, entries in leaderboard.items():
-        for entry in entries:
-            if entry["is_self"]:
-                rankings[category] = entry["rank"]
-                break
-        if category not in rankings:
-            rankings[category] = 0
+    Read from the cached leaderboard's position index when it is warm;
+    otherwise counted against the rollups, so a profile view never builds
+    and sorts the whole leaderboard unless the rollups are stale.
+    """
+    window = get_period_window(period)
+    ranked = leaderboard_cache.get(period, model, window)
+
+    if ranked is None and rollup_repo is not None:
+        counted = rollup_repo.get_ranks(period, window, api_key_id, model=model)
+        if counted is not None:
+            ranks, total = counted
+            return {
+                category: {"rank": rank, "percentile": rank_percentile(rank, total)}
+                for category, rank in ranks.items()
+            }
+
+    if ranked is None:
+        ranked = get_ranked_categories(usage_repo, period, model=model, rollup_repo=rollup_repo)
+
+    rankings = {}
+    for category in ranked.categories:
+        entry = ranked.entry(category, api_key_id)
+        rank = entry["rank"] if entry is not None else 0
+        rankings[category] = {"rank": rank, "percentile": rank_percentile(rank, ranked.total)}
 
     return rankings
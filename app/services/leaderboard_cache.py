@@ -0,0 +1,130 @@
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import TYPE_CHECKING, Dict, Optional, Set, Tuple
+
+from app.config import get_settings
+
+if TYPE_CHECKING:
+    from app.services.leaderboard import RankedLeaderboard
+
+logger = logging.getLogger(__name__)
+
+Window = Tuple[date, date]
+
+
+class LeaderboardCache:
+    """
+    In-process cache of RankedLeaderboards keyed by (period, model).
+
+    Entries are grouped per model and the number of model variants is LRU
+    bounded. Each entry remembers the date window it was computed for, so a
+    day rollover is a miss without any explicit invalidation. invalidate()
+    bumps a generation counter; results computed before it are not stored.
+    Invalidated entries are kept, marked stale, so get_stale() can serve them
+    while a fresh result is computed (stale-while-revalidate).
+    """
+
+    def __init__(self, max_models: int):
+        self.max_models = max_models
+        # model -> period -> (window, ranked, fresh)
+        self._models: "OrderedDict[Optional[str], Dict[str, Tuple[Window, RankedLeaderboard, bool]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, period: str, model: Optional[str], window: Window) -> Optional["RankedLeaderboard"]:
+        with self._lock:
+            entry = self._models.get(model, {}).get(period)
+            if entry is None or entry[0] != window or not entry[2]:
+                self.misses += 1
+                return None
+            self._models.move_to_end(model)
+            self.hits += 1
+            return entry[1]
+
+    def get_stale(self, period: str, model: Optional[str], window: Window) -> Optional["RankedLeaderboard"]:
+        """The last result for (period, model, window), even if invalidated since."""
+        with self._lock:
+            entry = self._models.get(model, {}).get(period)
+            if entry is None or entry[0] != window:
+                return None
+            self.stale_hits += 1
+            return entry[1]
+
+    def put(
+        self,
+        period: str,
+        model: Optional[str],
+        window: Window,
+        ranked: "RankedLeaderboard",
+        generation: int,
+    ):
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._models.setdefault(model, {})[period] = (window, ranked, True)
+            self._models.move_to_end(model)
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+                self.evictions += 1
+
+    def put_many(
+        self,
+        boards: Dict[Tuple[str, Optional[str]], Tuple[Window, "RankedLeaderboard"]],
+        generation: int,
+    ) -> bool:
+        """
+        Store {(period, model): (window, ranked)} all at once, so readers see
+        either none or all of them. Like put, nothing is stored if the cache
+        was invalidated since `generation` was read. Returns whether they were.
+        """
+        with self._lock:
+            if generation != self.generation:
+                return False
+            for (period, model), (window, ranked) in boards.items():
+                self._models.setdefault(model, {})[period] = (window, ranked, True)
+                self._models.move_to_end(model)
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def invalidate(self, dates: Optional[Set[date]] = None, models: Optional[Set[str]] = None):
+        """
+        Mark cached leaderboards affected by new usage on `dates` for `models`
+        stale. Unfiltered (model=None) leaderboards are affected by every
+        model; with no arguments everything is marked.
+        """
+        with self._lock:
+            for model, periods in self._models.items():
+                if models is not None and model is not None and model not in models:
+                    continue
+                for period, (window, ranked, fresh) in list(periods.items()):
+                    if fresh and (dates is None or any(window[0] <= d <= window[1] for d in dates)):
+                        periods[period] = (window, ranked, False)
+            self.generation += 1
+            self.invalidations += 1
+        logger.info("Leaderboard cache invalidated")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = [entry for periods in self._models.values() for entry in periods.values()]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale_hits": self.stale_hits,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "models": len(self._models),
+                "entries": len(entries),
+                "stale_entries": sum(1 for entry in entries if not entry[2]),
+            }
+
+
+leaderboard_cache = LeaderboardCache(max_models=get_settings().leaderboard_cache_max_models)
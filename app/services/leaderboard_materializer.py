@@ -0,0 +1,64 @@
+import asyncio
+import logging
+import time
+from datetime import date
+from typing import Dict, Optional, Set
+
+from app.database import run_in_db_executor
+from app.services.leaderboard import materialize_leaderboards
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderboardMaterializer:
+    """
+    Rebuilds every (period, model) leaderboard after each usage change.
+
+    Registered as a usage change handler after the cache invalidation, so
+    each fetch cycle is followed on every worker by one materialize_leaderboards
+    run instead of one computation per (period, model) on first request.
+    Changes arriving while a run is in progress trigger one more run.
+    """
+
+    def __init__(self):
+        self._pending = False
+        self._runner: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.boards = 0
+        self.last_duration_ms = 0
+
+    def on_usage_changed(self, dates: Optional[Set[date]] = None, models: Optional[Set[str]] = None):
+        """UsageChangeHandler; called on the event loop."""
+        self._pending = True
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._runner:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+
+    def stats(self) -> Dict[str, int]:
+        return {"runs": self.runs, "boards": self.boards, "last_duration_ms": self.last_duration_ms}
+
+    async def _run(self):
+        while self._pending:
+            self._pending = False
+            started = time.perf_counter()
+            try:
+                published = await run_in_db_executor(materialize_leaderboards)
+            except Exception as e:
+                logger.error(f"Failed to materialize leaderboards: {e}")
+                continue
+            self.runs += 1
+            self.last_duration_ms = int((time.perf_counter() - started) * 1000)
+            if published:
+                self.boards = published
+                logger.info(f"Materialized {published} leaderboards in {self.last_duration_ms} ms")
+
+
+leaderboard_materializer = LeaderboardMaterializer()
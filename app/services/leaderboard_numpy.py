@@ -0,0 +1,134 @@
+import logging
+from operator import itemgetter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency, only needed for LEADERBOARD_ENGINE=numpy
+    np = None
+
+from app.config import get_settings
+from app.models import UsageCounters
+from app.repositories.usage_repo import COUNTER_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+_warned = False
+
+
+def enabled() -> bool:
+    """Whether LEADERBOARD_ENGINE selects this engine and NumPy is installed."""
+    global _warned
+    if get_settings().leaderboard_engine != "numpy":
+        return False
+    if np is None:
+        if not _warned:
+            logger.warning("LEADERBOARD_ENGINE=numpy but NumPy is not installed; using the Python engine")
+            _warned = True
+        return False
+    return True
+
+
+def _factorize(values) -> Tuple["np.ndarray", list]:
+    """Codes numbering the distinct values in order of first appearance, and those values."""
+    if not isinstance(values, np.ndarray):
+        # A dict is several times faster than np.unique at factorizing strings
+        ids: Dict = {}
+        codes = np.fromiter((ids.setdefault(value, len(ids)) for value in values), dtype=np.intp)
+        return codes, list(ids)
+    uniques, first, codes = np.unique(values, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    renumber = np.empty_like(order)
+    renumber[order] = np.arange(len(order))
+    return renumber[codes.reshape(-1)], uniques[order].tolist()
+
+
+class UsageColumns:
+    """
+    A period's usage rows as columns: a developer index and a model index
+    per row (numbered in order of first appearance) and one int64 array
+    per counter.
+    """
+
+    def __init__(self, rows: Sequence[UsageCounters]):
+        def column(name: str):
+            # One pass per column; zip(*rows) is several times slower on millions of rows
+            return map(itemgetter(UsageCounters._fields.index(name)), rows)
+
+        self.key_index, self.keys = _factorize(column("api_key_id"))
+        self.model_index, self.models = _factorize(column("model"))
+        self.counters = {c: np.fromiter(column(c), dtype=np.int64, count=len(rows)) for c in COUNTER_COLUMNS}
+
+    def totals(self, model: Optional[str] = None) -> Tuple[List[str], Dict[str, "np.ndarray"]]:
+        """
+        Per-developer counter sums, optionally for one model, with developers
+        in order of first appearance like aggregate_snapshots.
+        """
+        key_index, keys, counters = self.key_index, self.keys, self.counters
+        if model is not None:
+            mask = self.model_index == (self.models.index(model) if model in self.models else -1)
+            key_index, present = _factorize(key_index[mask])
+            keys = [self.keys[k] for k in present]
+            counters = {c: values[mask] for c, values in counters.items()}
+
+        sums = {}
+        for column, values in counters.items():
+            # np.add.at rather than bincount: bincount sums in float64, which loses exactness on big totals
+            total = np.zeros(len(keys), dtype=np.int64)
+            np.add.at(total, key_index, values)
+            sums[column] = total
+        return keys, sums
+
+
+# Largest part * 20000 + whole for which the int64 path is exact: every
+# intermediate fits in int64 and the rounded quotient converts to float64 exactly
+_EXACT_INT64_LIMIT = 2 ** 53
+
+
+def _percent(part: "np.ndarray", whole: "np.ndarray", zero) -> list:
+    """percentage(part, whole) per developer, or `zero` where whole is 0."""
+    if not len(part):
+        return []
+    has_whole = whole > 0
+    denominator = np.where(has_whole, whole, 1)
+    if int(part.max()) * 20000 + int(denominator.max()) <= _EXACT_INT64_LIMIT:
+        scaled = (part * 20000 + denominator) // (2 * denominator)
+    else:
+        # Too big for int64: the same expression on Python ints, like percentage()
+        objects = denominator.astype(object)
+        scaled = (part.astype(object) * 20000 + objects) // (2 * objects)
+    values = (scaled / 100).tolist()
+    for i in np.flatnonzero(~has_whole).tolist():
+        values[i] = zero
+    return values
+
+
+def _rank(keys: List[str], values: list) -> List[Dict]:
+    """Entries sorted by value descending, with standard competition ranks."""
+    if not keys:
+        return []
+    array = np.asarray(values)
+    # Stable, like list.sort(reverse=True): ties keep their first-appearance order
+    order = np.argsort(-array, kind="stable")
+    ordered = array[order]
+    starts = np.ones(len(ordered), dtype=bool)
+    starts[1:] = ordered[1:] != ordered[:-1]
+    ranks = np.maximum.accumulate(np.where(starts, np.arange(1, len(ordered) + 1), 0))
+    return [
+        {"api_key_id": keys[i], "value": values[i], "rank": rank}
+        for i, rank in zip(order.tolist(), ranks.tolist())
+    ]
+
+
+def rank_columns(columns: UsageColumns, model: Optional[str] = None) -> Dict[str, List[Dict]]:
+    """The ranked categories rank_categories(aggregate_snapshots(rows)) would build."""
+    keys, sums = columns.totals(model)
+    uncached = sums["uncached_input_tokens"]
+    cache_read = sums["cache_read_input_tokens"]
+    total_input = uncached + cache_read
+    return {
+        "efficient_user": _rank(keys, _percent(sums["output_tokens"], total_input, 0)),
+        "cache_champion": _rank(keys, _percent(cache_read, total_input, 0.0)),
+        "wordsmith": _rank(keys, sums["output_tokens"].tolist()),
+        "tool_master": _rank(keys, sums["web_search_requests"].tolist()),
+    }
@@ -0,0 +1,259 @@
+import asyncio
+import json
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.config import get_settings
+from app.services.leaderboard import (
+    RankedLeaderboard,
+    get_period_window,
+    load_ranked,
+    mask_api_key,
+    rank_percentile,
+)
+
+logger = logging.getLogger(__name__)
+
+StreamKey = Tuple[str, Optional[str]]
+# category -> api_key_id -> (rank, value)
+Standings = Dict[str, Dict[str, Tuple[int, float]]]
+
+
+def format_event(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+RESYNC = format_event("resync", {"reason": "client fell behind; refetch /leaderboard"})
+AMBIGUOUS_RESYNC = format_event("resync", {"reason": "changed rows share a masked id; refetch /leaderboard"})
+
+
+def standings_of(ranked: RankedLeaderboard) -> Standings:
+    return {
+        category: {entry["api_key_id"]: (entry["rank"], entry["value"]) for entry in entries}
+        for category, entries in ranked.categories.items()
+    }
+
+
+def diff_standings(old: Standings, new: Standings) -> Tuple[Dict[str, List[Dict]], Dict[str, List[str]], Set[str]]:
+    """
+    Return (changed entries, removed api_key_ids, every api_key_id involved)
+    per category, by full api_key_id; mask them (see masked_diff) only for
+    output.
+    """
+    changes, removed, involved = {}, {}, set()
+    for category, entries in new.items():
+        previous = old.get(category, {})
+        changed = [
+            {"api_key_id": api_key_id, "rank": rank, "value": value}
+            for api_key_id, (rank, value) in entries.items()
+            if previous.get(api_key_id) != (rank, value)
+        ]
+        gone = [api_key_id for api_key_id in previous if api_key_id not in entries]
+        if changed:
+            changes[category] = sorted(changed, key=lambda entry: entry["rank"])
+        if gone:
+            removed[category] = gone
+        involved.update(entry["api_key_id"] for entry in changed)
+        involved.update(gone)
+    return changes, removed, involved
+
+
+def masked_diff(
+    old: Standings, new: Standings, changes: Dict[str, List[Dict]], removed: Dict[str, List[str]], involved: Set[str]
+) -> Optional[Tuple[Dict[str, List[Dict]], Dict[str, List[str]]]]:
+    """
+    (changes, removed) with api_key_ids masked, or None when a masked id
+    involved is shared with another developer on either board, since
+    clients couldn't tell which row it names.
+    """
+    owners: Dict[str, Set[str]] = {}
+    for standings in (old, new):
+        for api_key_id in next(iter(standings.values()), {}):
+            owners.setdefault(mask_api_key(api_key_id), set()).add(api_key_id)
+    if any(len(owners[mask_api_key(api_key_id)]) > 1 for api_key_id in involved):
+        return None
+    return (
+        {
+            category: [{**entry, "api_key_id": mask_api_key(entry["api_key_id"])} for entry in entries]
+            for category, entries in changes.items()
+        },
+        {category: [mask_api_key(k) for k in keys] for category, keys in removed.items()},
+    )
+
+
+class Subscriber:
+    """One open stream. Its queue is bounded; see send()."""
+
+    def __init__(self, key: StreamKey, api_key_id: Optional[str], max_queued: int):
+        self.key = key
+        self.api_key_id = api_key_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queued)
+
+    def send(self, message: str) -> bool:
+        """
+        Queue a message without waiting. A subscriber whose queue is full is
+        too slow to keep up: its backlog is dropped and replaced with a single
+        resync event, so one slow client never holds up the others or grows
+        memory. Returns False if the message was dropped.
+        """
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            return False
+
+
+class LeaderboardBroadcaster:
+    """
+    Pushes leaderboard changes to streaming subscribers of each (period, model).
+
+    Registered as a usage change handler, so it fires on every worker after
+    each fetch cycle. Changes arriving within `debounce_seconds` are handled
+    together. Each affected (period, model) is then recomputed once through
+    the leaderboard cache (sharing the computation with concurrent requests), diffed against the standings last published, and
+    the masked diff is serialized once and queued to every subscriber.
+    Subscribers whose own rows changed also get a `self` event with their
+    unmasked ranks. Period windows move at midnight without any new usage,
+    so every stream is also republished then.
+    """
+
+    def __init__(self, max_queued: int = 32, debounce_seconds: float = 0.5):
+        self.max_queued = max_queued
+        self.debounce_seconds = debounce_seconds
+        self._subscribers: Dict[StreamKey, Set[Subscriber]] = {}
+        self._standings: Dict[StreamKey, Standings] = {}
+        self._pending_dates: Set[date] = set()
+        self._pending_models: Set[str] = set()
+        self._pending_all = False
+        self._publisher: Optional[asyncio.Task] = None
+        self._rollover: Optional[asyncio.Task] = None
+        self.dropped = 0
+
+    async def subscribe(self, period: str, model: Optional[str], api_key_id: Optional[str] = None) -> Subscriber:
+        key = (period, model)
+        if key not in self._standings:
+            # Baseline for the first diff; clients load the full board from /leaderboard
+            ranked = await load_ranked(period, model)
+            self._standings.setdefault(key, standings_of(ranked))
+        subscriber = Subscriber(key, api_key_id, self.max_queued)
+        self._subscribers.setdefault(key, set()).add(subscriber)
+        if self._rollover is None or self._rollover.done():
+            self._rollover = asyncio.get_running_loop().create_task(self._watch_rollover())
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self._subscribers.get(subscriber.key)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[subscriber.key]
+            self._standings.pop(subscriber.key, None)
+
+    def on_usage_changed(self, dates: Optional[Set[date]], models: Optional[Set[str]]):
+        """UsageChangeHandler; called on the event loop."""
+        if not self._subscribers:
+            return
+        if dates is None or models is None:
+            self._pending_all = True
+        else:
+            self._pending_dates |= dates
+            self._pending_models |= models
+        if self._publisher is None or self._publisher.done():
+            self._publisher = asyncio.get_running_loop().create_task(self._publish())
+
+    async def stop(self):
+        for task in (self._publisher, self._rollover):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._publisher = self._rollover = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "streams": len(self._subscribers),
+            "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+            "dropped": self.dropped,
+        }
+
+    async def _publish(self):
+        # Changes that arrive while publishing are picked up by the next round
+        while self._pending_all or self._pending_dates:
+            await asyncio.sleep(self.debounce_seconds)
+            dates, models, everything = self._pending_dates, self._pending_models, self._pending_all
+            self._pending_dates, self._pending_models, self._pending_all = set(), set(), False
+            for key in list(self._subscribers):
+                if everything or self._affected(key, dates, models):
+                    await self._publish_key(key)
+
+    async def _watch_rollover(self):
+        while self._subscribers:
+            now = datetime.now()
+            midnight = datetime.combine(now.date() + timedelta(days=1), time.min)
+            await asyncio.sleep((midnight - now).total_seconds())
+            self.on_usage_changed(None, None)
+
+    async def _publish_key(self, key: StreamKey):
+        period, model = key
+        try:
+            # Diffs must be against the new data, never a stale leaderboard
+            ranked = await load_ranked(period, model, stale_ok=False)
+        except Exception as e:
+            logger.error(f"Failed to recompute leaderboard {key} for streaming: {e}")
+            return
+        if key not in self._subscribers:
+            return
+
+        old, new = self._standings.get(key, {}), standings_of(ranked)
+        changes, removed, involved = diff_standings(old, new)
+        self._standings[key] = new
+        if not involved:
+            return
+
+        masked = masked_diff(old, new, changes, removed, involved)
+        if masked is None:
+            message = AMBIGUOUS_RESYNC
+        else:
+            message = format_event("diff", {
+                "period": period,
+                "model": model,
+                "total": ranked.total,
+                "changes": masked[0],
+                "removed": masked[1],
+            })
+        for subscriber in list(self._subscribers.get(key, ())):
+            if not subscriber.send(message):
+                self.dropped += 1
+            if subscriber.api_key_id in involved:
+                subscriber.send(self._self_event(ranked, subscriber.api_key_id))
+
+    @staticmethod
+    def _affected(key: StreamKey, dates: Set[date], models: Set[str]) -> bool:
+        period, model = key
+        if model is not None and model not in models:
+            return False
+        start_date, end_date = get_period_window(period)
+        return any(start_date <= d <= end_date for d in dates)
+
+    @staticmethod
+    def _self_event(ranked: RankedLeaderboard, api_key_id: str) -> str:
+        rows = {}
+        for category in ranked.categories:
+            entry = ranked.entry(category, api_key_id)
+            rank = entry["rank"] if entry is not None else 0
+            rows[category] = {
+                "rank": rank,
+                "value": entry["value"] if entry is not None else None,
+                "percentile": rank_percentile(rank, ranked.total),
+            }
+        return format_event("self", {"api_key_id": api_key_id, "categories": rows})
+
+
+leaderboard_broadcaster = LeaderboardBroadcaster(max_queued=get_settings().leaderboard_stream_queue_size)
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from datetime import date
+from typing import Dict, List, Optional, Set
+
+from app.database import create_adapter, run_in_db_executor
+from app.repositories import ModelCatalogRepository
+
+logger = logging.getLogger(__name__)
+
+
+class ModelCatalog:
+    """
+    In-memory copy of model_catalog, so /models never touches usage_snapshot.
+
+    The table has one row per model and is kept current by the snapshot
+    upsert; this copy is reloaded after every usage change (registered as a
+    usage change handler), with changes arriving mid-reload handled by one
+    more reload.
+    """
+
+    def __init__(self):
+        self._models: Dict[str, Dict] = {}
+        self.loaded = False
+        self._pending = False
+        self._reloader: Optional[asyncio.Task] = None
+
+    def load(self):
+        """Blocking; run it on the DB executor."""
+        rows = ModelCatalogRepository(create_adapter()).get_all()
+        self._models = {row["model"]: row for row in rows}
+        self.loaded = True
+
+    async def ensure_loaded(self):
+        if not self.loaded:
+            await run_in_db_executor(self.load)
+
+    def on_usage_changed(self, dates: Optional[Set[date]] = None, models: Optional[Set[str]] = None):
+        """UsageChangeHandler; called on the event loop."""
+        self._pending = True
+        if self._reloader is None or self._reloader.done():
+            self._reloader = asyncio.get_running_loop().create_task(self._reload())
+
+    async def stop(self):
+        if self._reloader:
+            self._reloader.cancel()
+            try:
+                await self._reloader
+            except asyncio.CancelledError:
+                pass
+            self._reloader = None
+
+    def get_models(self, since: Optional[date] = None) -> List[str]:
+        """Model names, sorted; with `since`, only models with usage on or after that date."""
+        return sorted(
+            model for model, row in self._models.items()
+            if since is None or row["last_seen"] >= since
+        )
+
+    def get(self, model: str) -> Optional[Dict]:
+        """{"model", "first_seen", "last_seen", "snapshot_count"} for one model."""
+        return self._models.get(model)
+
+    async def _reload(self):
+        while self._pending:
+            self._pending = False
+            try:
+                await run_in_db_executor(self.load)
+            except Exception as e:
+                logger.error(f"Failed to reload the model catalogue: {e}")
+
+
+model_catalog = ModelCatalog()
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set
+
+from app.config import get_settings
+from app.database import create_adapter, run_in_db_executor
+from app.repositories import DeveloperRepository
+from app.services.backfill import default_backfill_range, schedule_backfill
+from app.services.scheduler import fetch_usage_for_api_keys
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+FETCHING = "fetching"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class RegistrationFetchQueue:
+    """
+    Fetches usage for newly registered API keys in the background.
+
+    Enqueueing a key that is already queued or being fetched is a no-op, and
+    every key that arrives while the worker waits `coalesce_seconds` (or while
+    a fetch is in flight) is served by the same next report request, so a
+    burst of registrations costs one org report instead of one each. Newly
+    created keys are then backfilled together, checkpointed per key so
+    resume_backfills can finish them after a restart. Job status is kept
+    per key for polling, bounded to the `max_tracked` most recent keys.
+    """
+
+    def __init__(self, coalesce_seconds: float = 2.0, max_tracked: int = 10000):
+        self.coalesce_seconds = coalesce_seconds
+        self.max_tracked = max_tracked
+        self._jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._pending: Set[str] = set()
+        self._backfill: Set[str] = set()
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    def enqueue(self, api_key_id: str, backfill: bool = False) -> Dict:
+        """Queue a usage fetch for api_key_id unless one is already pending, and return its job status."""
+        if backfill:
+            self._backfill.add(api_key_id)
+        job = self._jobs.get(api_key_id)
+        if job is not None and job["status"] in (QUEUED, FETCHING):
+            # The queued or in-flight fetch already covers this key
+            return dict(job)
+
+        job = {
+            "status": QUEUED,
+            "queued_at": datetime.utcnow(),
+            "completed_at": None,
+            "snapshots_fetched": None,
+            "error": None,
+        }
+        self._jobs[api_key_id] = job
+        self._jobs.move_to_end(api_key_id)
+        while len(self._jobs) > self.max_tracked:
+            self._jobs.popitem(last=False)
+        self._pending.add(api_key_id)
+        self._wakeup.set()
+        return dict(job)
+
+    def get_status(self, api_key_id: str) -> Optional[Dict]:
+        job = self._jobs.get(api_key_id)
+        return dict(job) if job is not None else None
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # Let a burst of registrations pile up before spending a report request on it
+            await asyncio.sleep(self.coalesce_seconds)
+            self._wakeup.clear()
+            keys, self._pending = self._pending, set()
+            if keys:
+                await self._fetch(keys)
+
+    async def resume_backfills(self):
+        """
+        Schedule one backfill for every key registered within the backfill
+        range, since those queued or running when the process stopped were
+        lost. Windows a key already has are skipped by its checkpoints.
+        """
+        since = datetime.combine(default_backfill_range()[0], datetime.min.time())
+        developers = await run_in_db_executor(DeveloperRepository(create_adapter()).get_registered_since, since)
+        if developers:
+            earliest = min(dev.registered_at for dev in developers).date()
+            schedule_backfill(
+                start_date=default_backfill_range(earliest)[0],
+                end_date=datetime.utcnow().date() - timedelta(days=1),
+                api_key_ids=[dev.api_key_id for dev in developers],
+                per_key_jobs=True,
+            )
+
+    async def _fetch(self, keys: Set[str]):
+        backfill_keys = sorted(keys & self._backfill)
+        self._backfill -= set(backfill_keys)
+
+        if not get_settings().anthropic_admin_api_key:
+            for key in keys:
+                self._set(key, status=SKIPPED, completed_at=datetime.utcnow(), error="No Anthropic Admin API key configured")
+            return
+
+        for key in keys:
+            self._set(key, status=FETCHING)
+        logger.info(f"Fetching usage for {len(keys)} newly registered API keys")
+
+        try:
+            written = await fetch_usage_for_api_keys(keys)
+        except Exception as e:
+            # Including an incomplete report, whose snapshots so far were still stored
+            logger.warning(f"Failed to fetch usage on registration: {e}")
+            for key in keys:
+                self._set(key, status=FAILED, completed_at=datetime.utcnow(), error=str(e))
+        else:
+            # One report served the whole batch, so the count is the batch's
+            for key in keys:
+                self._set(key, status=DONE, completed_at=datetime.utcnow(), snapshots_fetched=written)
+
+        if backfill_keys:
+            # History before today for the whole batch in one backfill
+            schedule_backfill(api_key_ids=backfill_keys, per_key_jobs=True)
+
+    def _set(self, api_key_id: str, **fields):
+        job = self._jobs.get(api_key_id)
+        if job is not None:
+            job.update(fields)
+
+
+registration_queue = RegistrationFetchQueue(coalesce_seconds=get_settings().registration_coalesce_seconds)
@@ -0,0 +1,59 @@
+import logging
+from datetime import date
+from typing import Optional, Iterable, Tuple
+from rococo.data import PostgreSQLAdapter
+
+from app.repositories import UsageRollupRepository, UsageCumulativeRepository
+from app.services.leaderboard import PERIODS, get_period_window
+
+logger = logging.getLogger(__name__)
+
+
+def refresh_rollups(adapter: PostgreSQLAdapter, api_key_ids: Optional[Iterable[str]] = None):
+    """
+    Bring usage_rollup up to date after snapshots were written.
+
+    Only the given developers are recomputed unless the period windows have
+    moved since the last refresh (day rollover), in which case every row is
+    rebuilt. Passing None always rebuilds everything. Blocking; run it on the
+    DB executor.
+    """
+    today = date.today()
+    windows = {period: get_period_window(period, today) for period in PERIODS}
+    rollup_repo = UsageRollupRepository(adapter)
+
+    with adapter:
+        if api_key_ids is not None and rollup_repo.get_windows() != windows:
+            logger.info("Rollup windows moved, rebuilding all rollups")
+            api_key_ids = None
+
+        if api_key_ids is None:
+            rollup_repo.refresh(windows)
+            logger.info(f"Rebuilt usage rollups for {today}")
+            return
+
+        api_key_ids = sorted(set(api_key_ids))
+        if api_key_ids:
+            rollup_repo.refresh(windows, api_key_ids)
+            logger.info(f"Refreshed usage rollups for {len(api_key_ids)} developers")
+
+
+def refresh_cumulative(adapter: PostgreSQLAdapter, written: Optional[Iterable[Tuple[str, date, str]]] = None):
+    """
+    Bring usage_cumulative up to date after the given (api_key_id,
+    snapshot_date, model) snapshots were written: each developer's running
+    totals are rebuilt from the earliest day written. Passing None rebuilds
+    everything. Blocking; run it on the DB executor.
+    """
+    cumulative_repo = UsageCumulativeRepository(adapter)
+    if written is None:
+        cumulative_repo.refresh_all()
+        logger.info("Rebuilt cumulative usage")
+        return
+
+    since = {}
+    for api_key_id, snapshot_date, _ in written:
+        since[api_key_id] = min(since.get(api_key_id, snapshot_date), snapshot_date)
+    if since:
+        cumulative_repo.refresh(since)
+        logger.info(f"Refreshed cumulative usage for {len(since)} developers")
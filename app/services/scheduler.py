@@ -1,153 +1,300 @@
+import itertools
 import logging
 from datetime import datetime, date, timedelta
-from typing import Optional
+from typing import AsyncIterator, Collection, Dict, Iterable, Optional, Set, Tuple
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from rococo.data import PostgreSQLAdapter
 
-from collections import defaultdict
 from app.config import get_settings
+from app.database import create_adapter, run_in_db_executor
 from app.models import UsageSnapshot
-from app.repositories import DeveloperRepository, UsageSnapshotRepository
-from app.services.anthropic_client import AnthropicAdminClient
+from app.repositories import DeveloperRepository, UsageSnapshotRepository, UsageHourlyRepository
+from app.repositories.usage_repo import COUNTER_COLUMNS
+from app.services.anthropic_client import UsageReportError, get_admin_client
+from app.services.leader import leader_election
+from app.services.leaderboard import get_period_window
+from app.services.leaderboard_cache import leaderboard_cache
+from app.services.rollups import refresh_rollups, refresh_cumulative
+from app.services.snapshot_maintenance import run_snapshot_maintenance
 
 logger = logging.getLogger(__name__)
 
 
-def aggregate_hourly_to_daily(records: list) -> list:
-    """Aggregate hourly usage records into daily totals by api_key_id + model + date."""
-    daily_totals = defaultdict(lambda: {
-        "uncached_input_tokens": 0,
-        "cache_read_input_tokens": 0,
-        "cache_creation_5m_tokens": 0,
-        "cache_creation_1h_tokens": 0,
-        "output_tokens": 0,
-        "web_search_requests": 0,
-    })
-
-    for record in records:
-        api_key_id = record.get("api_key_id")
-        model = record.get("model", "unknown")
-        bucket_date = record.get("_bucket_date", "")
-
-        if not api_key_id or not bucket_date:
-            continue
-
-        key = (api_key_id, model, bucket_date)
-
-        # Handle nested cache_creation structure from API
-        cache_creation = record.get("cache_creation", {})
-        server_tool_use = record.get("server_tool_use", {})
-
-        daily_totals[key]["uncached_input_tokens"] += record.get("uncached_input_tokens", 0)
-        daily_totals[key]["cache_read_input_tokens"] += record.get("cache_read_input_tokens", 0)
-        daily_totals[key]["cache_creation_5m_tokens"] += cache_creation.get("ephemeral_5m_input_tokens", 0)
-        daily_totals[key]["cache_creation_1h_tokens"] += cache_creation.get("ephemeral_1h_input_tokens", 0)
-        daily_totals[key]["output_tokens"] += record.get("output_tokens", 0)
-        daily_totals[key]["web_search_requests"] += server_tool_use.get("web_search_requests", 0)
-
-    # Convert back to list of records
-    aggregated = []
-    for (api_key_id, model, bucket_date), totals in daily_totals.items():
-        aggregated.append({
-            "api_key_id": api_key_id,
-            "model": model,
-            "_bucket_date": bucket_date,
-            **totals,
-        })
-
-    return aggregated
+def usage_counters(record: dict) -> tuple:
+    """Flatten one API result into COUNTER_COLUMNS order."""
+    # Handle nested cache_creation structure from API
+    cache_creation = record.get("cache_creation") or {}
+    server_tool_use = record.get("server_tool_use") or {}
+    return (
+        record.get("uncached_input_tokens", 0),
+        record.get("cache_read_input_tokens", 0),
+        cache_creation.get("ephemeral_5m_input_tokens", 0),
+        cache_creation.get("ephemeral_1h_input_tokens", 0),
+        record.get("output_tokens", 0),
+        server_tool_use.get("web_search_requests", 0),
+    )
+
+
+def parse_bucket_start(value: str) -> datetime:
+    """Parse a bucket's starting_at (e.g. 2025-01-01T13:00:00Z) as a naive UTC datetime."""
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+
 
 scheduler = AsyncIOScheduler()
 
+# (api_key_id, snapshot_date, model)
+SnapshotKey = Tuple[str, date, str]
 
-async def fetch_usage_for_api_key(api_key_id: str, adapter: Optional[PostgreSQLAdapter] = None) -> int:
+HOURLY_WATERMARK = "usage_report_hourly"
+
+
+def store_snapshots(adapter: PostgreSQLAdapter, snapshots, deferred: Optional[Set[SnapshotKey]] = None) -> int:
     """
-    Fetch usage data for a single API key ID.
-    Returns the number of snapshots upserted.
+    Upsert daily snapshots in one statement and refresh the running totals of
+    the developers whose snapshots changed, then publish_snapshots them; with
+    `deferred`, the written keys are added to it instead so the caller can
+    publish many batches at once.
+    Blocking; run it on the DB executor. Returns the number of snapshots written.
+    """
+    written = UsageSnapshotRepository(adapter).bulk_upsert_snapshots(snapshots)
+    refresh_cumulative(adapter, written)
+    if deferred is not None:
+        deferred.update(written)
+    else:
+        publish_snapshots(adapter, written)
+    return len(written)
+
+
+def publish_snapshots(adapter: PostgreSQLAdapter, written: Collection[SnapshotKey]):
+    """
+    Refresh the rollups of the developers with written days inside the
+    leaderboard windows, drop the affected cached leaderboards and notify
+    the other workers. Blocking; run it on the DB executor.
+    """
+    window_start, window_end = get_period_window("month")
+    refresh_rollups(adapter, {api_key_id for api_key_id, day, _ in written if window_start <= day <= window_end})
+    if written:
+        dates = {snapshot_date for _, snapshot_date, _ in written}
+        models = {model for _, _, model in written}
+        leaderboard_cache.invalidate(dates, models)
+        UsageSnapshotRepository(adapter).notify_changes(dates, models)
+
+
+def store_daily_totals(adapter: PostgreSQLAdapter, totals: dict, deferred: Optional[Set[SnapshotKey]] = None) -> int:
+    """Store {(api_key_id, snapshot_date, model): counters} as daily snapshots. See store_snapshots."""
+    fetched_at = datetime.utcnow()
+    snapshots = (
+        UsageSnapshot(
+            api_key_id=api_key_id,
+            snapshot_date=snapshot_date,
+            model=model,
+            fetched_at=fetched_at,
+            **dict(zip(COUNTER_COLUMNS, counters)),
+        )
+        for (api_key_id, snapshot_date, model), counters in totals.items()
+    )
+    return store_snapshots(adapter, snapshots, deferred)
+
+
+async def ingest_daily_report(
+    adapter: PostgreSQLAdapter,
+    pages: AsyncIterator[list],
+    api_key_ids: set,
+    deferred: Optional[Set[SnapshotKey]] = None,
+) -> int:
+    """
+    Fold a streamed usage report into daily totals for the given API keys and
+    store them as snapshots, flushing in batches of INGEST_BATCH_SIZE.
+
+    Each key's buckets arrive in time order (chunked reports interleave keys,
+    not days), so once a later day shows up for a key its open day is
+    complete and moves to the batch to be written. Open days are kept apart
+    from the batch, so nothing is rescanned; memory is bounded by the batch
+    size plus each key's open day, not by the report. Returns the number of
+    snapshots written. A UsageReportError is re-raised after the days
+    received so far have been stored. `deferred` is passed on to
+    store_snapshots.
+    """
+    batch_size = get_settings().ingest_batch_size
+    # api_key_id -> (day, {model: counters}) still receiving buckets
+    open_days: Dict[str, Tuple[date, Dict[str, tuple]]] = {}
+    ready: Dict[SnapshotKey, tuple] = {}
+    written = 0
+
+    def add(totals: Dict, key, counters: tuple):
+        running = totals.get(key)
+        totals[key] = counters if running is None else tuple(map(sum, zip(running, counters)))
+
+    def close(api_key_id: str, day: date, models: Dict[str, tuple]):
+        for model, counters in models.items():
+            add(ready, (api_key_id, day, model), counters)
+
+    async def flush():
+        nonlocal written
+        while ready:
+            batch = dict(itertools.islice(ready.items(), batch_size))
+            for key in batch:
+                del ready[key]
+            written += await run_in_db_executor(store_daily_totals, adapter, batch, deferred)
+
+    try:
+        async for buckets in pages:
+            for bucket in buckets:
+                bucket_date = date.fromisoformat(bucket["starting_at"][:10])
+                for result in bucket.get("results", []):
+                    api_key_id = result.get("api_key_id")
+                    if api_key_id not in api_key_ids:
+                        continue
+                    model = result.get("model", "unknown")
+                    open_day = open_days.get(api_key_id)
+                    if open_day is None or bucket_date > open_day[0]:
+                        if open_day is not None:
+                            close(api_key_id, *open_day)
+                        open_day = open_days[api_key_id] = (bucket_date, {})
+                    if bucket_date == open_day[0]:
+                        add(open_day[1], model, usage_counters(result))
+                    else:
+                        # Out of order after all: fold it into the batch rather than drop it
+                        add(ready, (api_key_id, bucket_date, model), usage_counters(result))
+            if len(ready) >= batch_size:
+                await flush()
+    finally:
+        for api_key_id, open_day in open_days.items():
+            close(api_key_id, *open_day)
+        await flush()
+    return written
+
+
+async def ingest_hourly_report(
+    adapter: PostgreSQLAdapter,
+    pages: AsyncIterator[list],
+    api_key_ids: set,
+    watermark: Optional[datetime] = None,
+) -> int:
+    """
+    Stream raw hourly buckets for the given API keys into usage_hourly in
+    batches of INGEST_BATCH_SIZE, then recompute the daily snapshots of every
+    (developer, day) whose buckets changed. If the whole report arrived and a
+    watermark is given, it is stored and buckets older than the retention
+    window are pruned. After a failed page the buckets received so far are
+    still stored and their snapshots written, but the watermark is left
+    alone, so the next cycle fetches the rest, and the UsageReportError is
+    re-raised. Returns the number of snapshots written.
     """
     settings = get_settings()
+    hourly_repo = UsageHourlyRepository(adapter)
+    batch = []
+    changed_keys, changed_dates = set(), set()
+    buckets_changed = 0
+
+    async def flush():
+        nonlocal batch, buckets_changed
+        if not batch:
+            return
+        rows, batch = batch, []
+        changed = await run_in_db_executor(hourly_repo.upsert_buckets, rows, datetime.utcnow())
+        buckets_changed += len(changed)
+        for api_key_id, bucket_start, _ in changed:
+            changed_keys.add(api_key_id)
+            changed_dates.add(bucket_start.date())
+
+    failure: Optional[UsageReportError] = None
+    try:
+        async for buckets in pages:
+            for bucket in buckets:
+                bucket_start = parse_bucket_start(bucket["starting_at"])
+                for result in bucket.get("results", []):
+                    if result.get("api_key_id") in api_key_ids:
+                        batch.append((
+                            result["api_key_id"], bucket_start, result.get("model", "unknown"), *usage_counters(result)
+                        ))
+            if len(batch) >= settings.ingest_batch_size:
+                await flush()
+    except UsageReportError as e:
+        logger.warning("Usage report incomplete, keeping the buckets received so far")
+        failure = e
+    await flush()
+
+    written = 0
+    if changed_keys:
+        daily = await run_in_db_executor(
+            hourly_repo.get_daily_totals, sorted(changed_keys), min(changed_dates), max(changed_dates)
+        )
+        written = await run_in_db_executor(store_snapshots, adapter, daily)
+        logger.info(f"{buckets_changed} hourly buckets changed, {written} daily snapshots updated")
+
+    if failure is not None:
+        raise failure
+    if watermark is not None:
+        await run_in_db_executor(hourly_repo.set_watermark, HOURLY_WATERMARK, watermark)
+        await run_in_db_executor(
+            hourly_repo.prune_before, watermark - timedelta(days=settings.ingest_hourly_retention_days)
+        )
+    return written
+
+
+def get_ingest_start(watermark: Optional[datetime], current_hour: datetime) -> datetime:
+    """
+    First hour to request: midnight UTC of the day holding the last complete
+    hour before the watermark (less any extra lookback for late corrections),
+    or of today on first run.
+
+    Every day whose buckets change is recomputed from usage_hourly alone, so
+    the request always starts on a day boundary: usage_hourly may not hold
+    the earlier hours of that day (first run, a failed registration fetch),
+    and summing a partial day would overwrite its full backfilled snapshot.
+    """
+    if watermark is None:
+        start = current_hour
+    else:
+        start = min(watermark, current_hour) - timedelta(hours=get_settings().ingest_lookback_hours)
+    return datetime.combine(start.date(), datetime.min.time())
+
+
+async def fetch_usage_for_api_keys(api_key_ids: Iterable[str], adapter: Optional[PostgreSQLAdapter] = None) -> int:
+    """
+    Fetch today's usage for the given API key IDs with a single report request.
+    Returns the number of snapshots upserted; errors propagate to the caller.
+    """
+    settings = get_settings()
+    api_key_ids = set(api_key_ids)
 
     if not settings.anthropic_admin_api_key:
         logger.warning("No Anthropic Admin API key configured, skipping fetch")
         return 0
 
-    logger.info(f"Fetching usage data for API key: {api_key_id[:10]}...")
+    logger.info(f"Fetching usage data for {len(api_key_ids)} API keys")
 
-    client = AnthropicAdminClient(settings.anthropic_admin_api_key)
+    client = get_admin_client()
 
     # Create adapter if not provided
     owns_adapter = adapter is None
     if owns_adapter:
-        adapter = PostgreSQLAdapter(
-            settings.database_host,
-            settings.database_port,
-            settings.database_user,
-            settings.database_password,
-            settings.database_name,
-        )
+        adapter = create_adapter()
 
     try:
-        usage_repo = UsageSnapshotRepository(adapter)
-
-        # Fetch only today (24 hourly buckets = 1 page, no pagination needed)
-        # Historical data accumulates in DB over time for week/month stats
-        now_utc = datetime.utcnow()
-        today_utc = now_utc.date()
-        starting_at = datetime.combine(today_utc, datetime.min.time())
-        ending_at = datetime.combine(today_utc + timedelta(days=1), datetime.min.time())
-
-        usage_data = await client.get_usage_report(
+        # Cover every day the incremental fetch may still recompute from hourly buckets
+        hourly_repo = UsageHourlyRepository(adapter)
+        watermark = await run_in_db_executor(hourly_repo.get_watermark, HOURLY_WATERMARK)
+        current_hour = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        starting_at = get_ingest_start(watermark, current_hour)
+        ending_at = current_hour + timedelta(hours=1)
+
+        pages = client.iter_usage_report_for_keys(
             starting_at=starting_at,
             ending_at=ending_at,
+            api_key_ids=api_key_ids,
             group_by=["api_key_id", "model"],
-            bucket_width="1h",  # Use hourly to capture today's incomplete data
+            bucket_width="1h",
         )
+        fetched_count = await ingest_hourly_report(adapter, pages, api_key_ids)
 
-        if usage_data is None:
-            logger.error("Failed to fetch usage data")
-            return 0
-
-        # Aggregate hourly data into daily totals
-        daily_records = aggregate_hourly_to_daily(usage_data)
-        logger.info(f"Aggregated {len(usage_data)} hourly records into {len(daily_records)} daily records")
-
-        fetched_count = 0
-        for record in daily_records:
-            record_api_key_id = record.get("api_key_id")
-            if record_api_key_id != api_key_id:
-                continue
-
-            model = record.get("model", "unknown")
-            bucket_date_str = record.get("_bucket_date", str(today_utc))
-            snapshot_date = date.fromisoformat(bucket_date_str)
-
-            snapshot = UsageSnapshot(
-                api_key_id=api_key_id,
-                snapshot_date=snapshot_date,
-                model=model,
-                uncached_input_tokens=record.get("uncached_input_tokens", 0),
-                cache_read_input_tokens=record.get("cache_read_input_tokens", 0),
-                cache_creation_5m_tokens=record.get("cache_creation_5m_tokens", 0),
-                cache_creation_1h_tokens=record.get("cache_creation_1h_tokens", 0),
-                output_tokens=record.get("output_tokens", 0),
-                web_search_requests=record.get("web_search_requests", 0),
-                fetched_at=datetime.utcnow(),
-            )
-
-            usage_repo.upsert_snapshot(snapshot)
-            fetched_count += 1
-
-        logger.info(f"Fetched {fetched_count} usage snapshots for {api_key_id[:10]}...")
+        logger.info(f"Fetched {fetched_count} usage snapshots for {len(api_key_ids)} API keys")
         return fetched_count
-
-    except Exception as e:
-        logger.error(f"Error fetching usage data for {api_key_id[:10]}...: {e}")
-        return 0
     finally:
         if owns_adapter:
             adapter.close_connection()
-        await client.close()
 
 
 async def fetch_usage_data():
@@ -159,95 +306,74 @@ async def fetch_usage_data():
 
     logger.info("Starting usage data fetch...")
 
-    client = AnthropicAdminClient(settings.anthropic_admin_api_key)
-    adapter = PostgreSQLAdapter(
-        settings.database_host,
-        settings.database_port,
-        settings.database_user,
-        settings.database_password,
-        settings.database_name,
-    )
+    client = get_admin_client()
+    adapter = create_adapter()
 
     try:
         dev_repo = DeveloperRepository(adapter)
-        usage_repo = UsageSnapshotRepository(adapter)
 
-        registered_api_keys = set(dev_repo.get_all_api_key_ids())
+        registered_api_keys = set(await run_in_db_executor(dev_repo.get_all_api_key_ids))
 
         if not registered_api_keys:
             logger.info("No registered developers, skipping fetch")
             return
 
-        # Use UTC for consistency with Anthropic API
-        # Fetch only today (24 hourly buckets = 1 page, no pagination needed)
-        # Historical data accumulates in DB over time for week/month stats
-        now_utc = datetime.utcnow()
-        today_utc = now_utc.date()
-        starting_at = datetime.combine(today_utc, datetime.min.time())
-        ending_at = datetime.combine(today_utc + timedelta(days=1), datetime.min.time())
+        # Use UTC for consistency with Anthropic API. Only the days since the
+        # watermark (plus a lookback for late corrections) are requested.
+        hourly_repo = UsageHourlyRepository(adapter)
+        watermark = await run_in_db_executor(hourly_repo.get_watermark, HOURLY_WATERMARK)
+        current_hour = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        starting_at = get_ingest_start(watermark, current_hour)
+        ending_at = current_hour + timedelta(hours=1)
 
-        usage_data = await client.get_usage_report(
+        pages = client.iter_usage_report_for_keys(
             starting_at=starting_at,
             ending_at=ending_at,
+            api_key_ids=registered_api_keys,
             group_by=["api_key_id", "model"],
-            bucket_width="1h",  # Use hourly to capture today's incomplete data
+            bucket_width="1h",
         )
+        # The current hour is still filling up, so the next cycle starts from it
+        fetched_count = await ingest_hourly_report(adapter, pages, registered_api_keys, watermark=current_hour)
 
-        if usage_data is None:
-            logger.error("Failed to fetch usage data")
-            return
-
-        # Aggregate hourly data into daily totals
-        daily_records = aggregate_hourly_to_daily(usage_data)
-        logger.info(f"Aggregated {len(usage_data)} hourly records into {len(daily_records)} daily records")
-
-        fetched_count = 0
-        for record in daily_records:
-            api_key_id = record.get("api_key_id")
-            if not api_key_id or api_key_id not in registered_api_keys:
-                continue
-
-            model = record.get("model", "unknown")
-            bucket_date_str = record.get("_bucket_date", str(today_utc))
-            snapshot_date = date.fromisoformat(bucket_date_str)
-
-            snapshot = UsageSnapshot(
-                api_key_id=api_key_id,
-                snapshot_date=snapshot_date,
-                model=model,
-                uncached_input_tokens=record.get("uncached_input_tokens", 0),
-                cache_read_input_tokens=record.get("cache_read_input_tokens", 0),
-                cache_creation_5m_tokens=record.get("cache_creation_5m_tokens", 0),
-                cache_creation_1h_tokens=record.get("cache_creation_1h_tokens", 0),
-                output_tokens=record.get("output_tokens", 0),
-                web_search_requests=record.get("web_search_requests", 0),
-                fetched_at=datetime.utcnow(),
-            )
-
-            usage_repo.upsert_snapshot(snapshot)
-            fetched_count += 1
-
-        logger.info(f"Successfully fetched and stored usage data for {fetched_count} developers")
+        logger.info(f"Successfully fetched usage data, {fetched_count} snapshots changed")
 
     except Exception as e:
         logger.error(f"Error during usage data fetch: {e}")
     finally:
         adapter.close_connection()
-        await client.close()
+
+
+async def run_scheduled_fetch():
+    """Run fetch_usage_data only if this process holds scheduler leadership."""
+    if not await run_in_db_executor(leader_election.try_acquire):
+        logger.info(f"Not the scheduler leader (leader: {leader_election.leader_id}), skipping fetch")
+        return
+    await fetch_usage_data()
 
 
 def start_scheduler(interval_minutes: int = 5):
     scheduler.add_job(
-        fetch_usage_data,
+        run_scheduled_fetch,
         trigger=IntervalTrigger(minutes=interval_minutes),
         id="fetch_usage_data",
         name="Fetch usage data from Anthropic Admin API",
         replace_existing=True,
     )
+    # Also runs once at startup so a fresh deployment has this month's partitions
+    scheduler.add_job(
+        run_snapshot_maintenance,
+        trigger=IntervalTrigger(hours=24),
+        id="maintain_usage_snapshot",
+        name="Create usage_snapshot partitions and compact old months",
+        next_run_time=datetime.now(),
+        replace_existing=True,
+    )
     scheduler.start()
     logger.info(f"Scheduler started with {interval_minutes}-minute interval")
 
 
 def stop_scheduler():
     scheduler.shutdown()
+    leader_election.release()
     logger.info("Scheduler stopped")
@@ -0,0 +1,50 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one in-flight computation.
+
+    The first caller starts `factory()`; callers arriving before it finishes
+    await the same result (or exception). The computation is shielded, so a
+    caller that goes away (e.g. a client disconnect) does not cancel it for
+    the others. Nothing is remembered once it completes; caching is the
+    caller's business.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.started = 0
+        self.joined = 0
+
+    def start(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """Return the in-flight computation for key, starting it if there is none."""
+        future = self._inflight.get(key)
+        if future is not None:
+            self.joined += 1
+            return future
+
+        future = asyncio.ensure_future(factory())
+        self._inflight[key] = future
+        self.started += 1
+
+        def finished(done: asyncio.Future):
+            if self._inflight.get(key) is done:
+                del self._inflight[key]
+            # Retrieve the exception so background refreshes nobody awaits don't warn
+            if not done.cancelled() and done.exception() is not None:
+                logger.warning(f"{self.name} computation for {key!r} failed: {done.exception()}")
+
+        future.add_done_callback(finished)
+        return future
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        return await asyncio.shield(self.start(key, factory))
+
+    def stats(self) -> Dict[str, int]:
+        return {"started": self.started, "joined": self.joined, "in_flight": len(self._inflight)}
@@ -0,0 +1,81 @@
+import logging
+from datetime import date
+from typing import Dict, Optional
+
+from rococo.data import PostgreSQLAdapter
+
+from app.config import get_settings
+from app.database import create_adapter, run_in_db_executor
+from app.repositories import UsageSnapshotRepository, UsageCumulativeRepository
+from app.services.leader import leader_election
+
+logger = logging.getLogger(__name__)
+
+
+def add_months(month: date, months: int) -> date:
+    """First day of the month `months` after (or before, if negative) month's."""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def compaction_cutoff(today: Optional[date] = None) -> Optional[date]:
+    """
+    First day of the oldest month whose daily snapshots are kept; months
+    before it are compacted. None when SNAPSHOT_COMPACT_AFTER_MONTHS is 0.
+    """
+    months = get_settings().snapshot_compact_after_months
+    if months <= 0:
+        return None
+    # Never closer than the month leaderboard's window, which reads daily rows
+    return add_months((today or date.today()).replace(day=1), -max(months, 2))
+
+
+def maintain_snapshots(adapter: PostgreSQLAdapter, today: Optional[date] = None) -> Dict[str, int]:
+    """
+    Create the usage_snapshot partitions for the coming months, then compact
+    every month before the cutoff that still has daily rows and rebuild the
+    running totals from the first of them. Blocking; run it on the DB
+    executor. Returns counts of what was done.
+    """
+    settings = get_settings()
+    this_month = (today or date.today()).replace(day=1)
+    usage_repo = UsageSnapshotRepository(adapter)
+
+    created = usage_repo.ensure_partitions(
+        this_month, add_months(this_month, settings.snapshot_partitions_ahead_months)
+    )
+
+    compacted, removed, oldest = 0, 0, None
+    cutoff = compaction_cutoff(today)
+    if cutoff is not None:
+        for month in usage_repo.get_partition_months():
+            if month >= cutoff:
+                break
+            if usage_repo.has_daily_rows(month):
+                removed += usage_repo.compact_month(month)
+                compacted += 1
+                oldest = oldest or month
+                logger.info(f"Compacted usage snapshots for {month:%Y-%m}")
+    if oldest is not None:
+        # Running totals had a row per compacted day
+        UsageCumulativeRepository(adapter).refresh_all(since=oldest)
+
+    logger.info(
+        f"Snapshot maintenance: {created} partitions created, {compacted} months compacted, "
+        f"{removed} daily rows merged"
+    )
+    return {"partitions_created": created, "months_compacted": compacted, "rows_removed": removed}
+
+
+async def run_snapshot_maintenance():
+    """Run maintain_snapshots only if this process holds scheduler leadership."""
+    if not await run_in_db_executor(leader_election.try_acquire):
+        logger.info(f"Not the scheduler leader (leader: {leader_election.leader_id}), skipping snapshot maintenance")
+        return
+    adapter = create_adapter()
+    try:
+        await run_in_db_executor(maintain_snapshots, adapter)
+    except Exception as e:
+        logger.error(f"Error during snapshot maintenance: {e}")
+    finally:
+        adapter.close_connection()
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import logging
+from datetime import date
+from typing import Callable, List, Optional, Set
+
+import psycopg2
+from psycopg2 import extensions
+
+from app.config import get_settings
+from app.database import run_in_db_executor
+from app.repositories.usage_repo import USAGE_CHANGED_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT_SECONDS = 10
+
+# Called with (dates, models) when another process reports new usage; None means "assume anything changed"
+UsageChangeHandler = Callable[[Optional[Set[date]], Optional[Set[str]]], None]
+
+
+class UsageChangeListener:
+    """
+    LISTENs on USAGE_CHANGED_CHANNEL over a dedicated connection and fans each
+    notification out to the registered handlers.
+
+    The connection's socket is watched with loop.add_reader, so no thread or
+    polling is involved in listening; only (re)connecting, which blocks, runs
+    on the DB executor. A watchdog reconnects if the connection drops and
+    then fires every handler with None, since notifications may have been
+    missed while disconnected.
+    """
+
+    def __init__(self, check_interval_seconds: float = 30.0):
+        self._handlers: List[UsageChangeHandler] = []
+        self._conn = None
+        self._fileno: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._watchdog: Optional[asyncio.Task] = None
+        self._check_interval = check_interval_seconds
+
+    def add_handler(self, handler: UsageChangeHandler):
+        if handler not in self._handlers:
+            self._handlers.append(handler)
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        try:
+            await self._connect()
+        except psycopg2.Error as e:
+            logger.warning(f"Usage listener failed to connect, will retry: {e}")
+        self._watchdog = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._watchdog:
+            self._watchdog.cancel()
+            try:
+                await self._watchdog
+            except asyncio.CancelledError:
+                pass
+            self._watchdog = None
+        self._disconnect()
+
+    async def _connect(self):
+        # Connecting blocks (DNS, TCP, auth), so it must stay off the event loop
+        conn = await run_in_db_executor(self._open)
+        self._conn = conn
+        self._fileno = conn.fileno()
+        self._loop.add_reader(self._fileno, self._on_readable)
+        logger.info(f"Listening for usage changes on {USAGE_CHANGED_CHANNEL}")
+
+    @staticmethod
+    def _open():
+        settings = get_settings()
+        conn = psycopg2.connect(
+            host=settings.database_host,
+            port=settings.database_port,
+            user=settings.database_user,
+            password=settings.database_password,
+            database=settings.database_name,
+            connect_timeout=CONNECT_TIMEOUT_SECONDS,
+        )
+        conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {USAGE_CHANGED_CHANNEL}")
+        return conn
+
+    def _disconnect(self):
+        if self._conn is None:
+            return
+        # Use the fd captured at connect time; fileno() raises once the connection is closed
+        self._loop.remove_reader(self._fileno)
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+    def _on_readable(self):
+        try:
+            self._conn.poll()
+        except psycopg2.Error as e:
+            logger.warning(f"Usage listener connection lost: {e}")
+            self._disconnect()
+            return
+
+        while self._conn.notifies:
+            notify = self._conn.notifies.pop(0)
+            try:
+                payload = json.loads(notify.payload)
+                dates = payload.get("dates", [])
+                dates = None if dates is None else {date.fromisoformat(d) for d in dates}
+                models = set(payload.get("models", []))
+            except (ValueError, TypeError, AttributeError):
+                logger.warning(f"Malformed usage notification, treating everything as changed: {notify.payload!r}")
+                dates, models = None, None
+            self._dispatch(dates, models)
+
+    def _dispatch(self, dates: Optional[Set[date]], models: Optional[Set[str]]):
+        for handler in self._handlers:
+            try:
+                handler(dates, models)
+            except Exception as e:
+                logger.error(f"Usage change handler {handler!r} failed: {e}")
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self._check_interval)
+            if self._conn is not None and not self._conn.closed:
+                continue
+            self._disconnect()
+            try:
+                await self._connect()
+            except psycopg2.Error as e:
+                logger.warning(f"Usage listener reconnect failed: {e}")
+                continue
+            self._dispatch(None, None)
+
+
+usage_listener = UsageChangeListener()
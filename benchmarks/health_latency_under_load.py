@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Measure /health latency while a large leaderboard computation is running.
+
+In-memory fake repositories are passed to calculate_leaderboard, so no
+database is needed and nothing in the app is patched; the computation is
+the one /api/leaderboard runs on a cold cache. The same load is run twice:
+once on the event loop (the old behaviour) and once through
+run_in_db_executor, as the route does.
+
+    python -m benchmarks.health_latency_under_load --developers 20000 --scan-seconds 1.0
+"""
+import argparse
+import asyncio
+import functools
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+import httpx
+
+from app.database import run_in_db_executor
+from app.main import app
+from app.services.leaderboard import calculate_leaderboard
+from app.services.leaderboard_cache import leaderboard_cache
+from app.models import Developer, UsageSnapshot
+
+
+class FakeUsageRepo:
+    def __init__(self, snapshots, scan_seconds: float):
+        self.snapshots = snapshots
+        self.scan_seconds = scan_seconds
+
+    def get_counters_for_period(self, start_date, end_date, model=None):
+        # Stand-in for the blocking psycopg2 round trip of a month-long scan
+        time.sleep(self.scan_seconds)
+        return [s for s in self.snapshots if start_date <= s.snapshot_date <= end_date]
+
+
+class FakeRollupRepo:
+    def get_period_totals(self, period, window, model=None):
+        # Always stale, so every leaderboard computation does the full scan
+        return None
+
+
+class FakeDeveloperRepo:
+    def __init__(self, developers):
+        self.developers = developers
+
+    def get_all_active(self):
+        return self.developers
+
+    def get_by_api_key_id(self, api_key_id):
+        return next((dev for dev in self.developers if dev.api_key_id == api_key_id), None)
+
+
+def build_dataset(developers: int, models: int, days: int):
+    today = date.today()
+    rng = random.Random(42)
+    devs = [Developer(api_key_id=f"apikey_{i:08d}", name=f"dev {i}") for i in range(developers)]
+    snapshots = [
+        UsageSnapshot(
+            api_key_id=f"apikey_{i:08d}",
+            snapshot_date=today - timedelta(days=d),
+            model=f"model-{m}",
+            uncached_input_tokens=rng.randint(0, 10_000),
+            cache_read_input_tokens=rng.randint(0, 10_000),
+            output_tokens=rng.randint(0, 10_000),
+            web_search_requests=rng.randint(0, 10),
+        )
+        for i in range(developers)
+        for m in range(models)
+        for d in range(days)
+    ]
+    return devs, snapshots
+
+
+def p99(samples):
+    return statistics.quantiles(samples, n=100, method="inclusive")[98] if len(samples) >= 2 else samples[0]
+
+
+async def probe_health(client: httpx.AsyncClient, stop: asyncio.Event, interval: float):
+    # Latency is measured from when the probe was due, so time spent waiting
+    # for a blocked event loop to wake the prober counts against it.
+    samples = []
+    due = time.perf_counter()
+    while True:
+        await client.get("/health")
+        finished = time.perf_counter()
+        samples.append((finished - due) * 1000)
+        if stop.is_set():
+            return samples
+        due = finished + interval
+        await asyncio.sleep(interval)
+
+
+async def run(label: str, load, duration: float, interval: float):
+    """Probe /health while `load()` (or, without one, nothing for `duration` seconds) runs."""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(20):
+            await client.get("/health")
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe_health(client, stop, interval))
+        await asyncio.sleep(0.1)
+        started = time.perf_counter()
+        if load is not None:
+            # Every loaded run must recompute rather than serve the previous leaderboard
+            leaderboard_cache.invalidate()
+            await load()
+        else:
+            await asyncio.sleep(duration)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        samples = await prober
+
+    print(
+        f"{label:<28} {elapsed:6.2f} s  n={len(samples):>5}  p50={statistics.median(samples):8.2f} ms  "
+        f"p99={p99(samples):8.2f} ms  max={max(samples):8.2f} ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--developers", type=int, default=20_000)
+    parser.add_argument("--models", type=int, default=3)
+    parser.add_argument("--days", type=int, default=10)
+    parser.add_argument("--scan-seconds", type=float, default=1.0, help="Simulated DB time of the period scan")
+    parser.add_argument("--interval", type=float, default=0.005, help="Seconds between /health probes")
+    args = parser.parse_args()
+
+    developers, snapshots = build_dataset(args.developers, args.models, args.days)
+    print(f"{len(snapshots)} snapshots, {args.developers} developers")
+    compute = functools.partial(
+        calculate_leaderboard,
+        usage_repo=FakeUsageRepo(snapshots, args.scan_seconds),
+        dev_repo=FakeDeveloperRepo(developers),
+        period="month",
+        rollup_repo=FakeRollupRepo(),
+    )
+
+    async def on_event_loop():
+        compute()
+
+    async def on_db_executor():
+        await run_in_db_executor(compute)
+
+    await run("idle", None, duration=1.0, interval=args.interval)
+    await run("leaderboard on event loop", on_event_loop, duration=0, interval=args.interval)
+    await run("leaderboard on DB executor", on_db_executor, duration=0, interval=args.interval)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
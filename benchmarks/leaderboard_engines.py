@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Compare the Python and NumPy leaderboard engines on one period's usage rows.
+
+`python` is rank_categories(aggregate_snapshots(rows)); `numpy` is
+rank_columns(UsageColumns(rows)) from app/services/leaderboard_numpy.py,
+timed with loading the rows into columns. Rows are generated as the
+UsageCounters get_counters_for_period returns, so no database is needed.
+Both engines must produce identical categories.
+
+    python -m benchmarks.leaderboard_engines --developers 10000 --models 20 --days 30
+"""
+import argparse
+import gc
+import random
+import time
+from datetime import date, timedelta
+
+from app.models import UsageCounters
+from app.services.leaderboard import aggregate_snapshots, rank_categories
+from app.services.leaderboard_numpy import UsageColumns, rank_columns
+
+
+def build_rows(developers: int, models: int, days: int):
+    rng = random.Random(42)
+    today = date.today()
+    keys = [f"apikey_{i:08d}" for i in range(developers)]
+    model_names = [f"model-{m}" for m in range(models)]
+    dates = [today - timedelta(days=d) for d in range(days)]
+    return [
+        UsageCounters(
+            key,
+            snapshot_date,
+            model,
+            rng.randint(0, 10_000),
+            rng.randint(0, 10_000),
+            0,
+            0,
+            rng.randint(0, 10_000),
+            rng.randint(0, 10),
+        )
+        for snapshot_date in dates
+        for model in model_names
+        for key in keys
+    ]
+
+
+def timed(label: str, func):
+    gc.collect()
+    started = time.perf_counter()
+    result = func()
+    print(f"{label:<24} {(time.perf_counter() - started) * 1000:9.1f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--developers", type=int, default=10_000)
+    parser.add_argument("--models", type=int, default=20)
+    parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+
+    rows = build_rows(args.developers, args.models, args.days)
+    print(f"{len(rows)} rows: {args.developers} developers x {args.models} models x {args.days} days")
+
+    python = timed("python", lambda: rank_categories(aggregate_snapshots(rows)).categories)
+    columns = timed("numpy: load columns", lambda: UsageColumns(rows))
+    numpy = timed("numpy: aggregate + rank", lambda: rank_columns(columns))
+    assert python == numpy, "engines disagree"
+
+    # One model out of the same columns, as a per-model leaderboard would
+    model = "model-0"
+    python = timed(f"python ({model})", lambda: rank_categories(
+        aggregate_snapshots(row for row in rows if row.model == model)
+    ).categories)
+    numpy = timed(f"numpy ({model})", lambda: rank_columns(columns, model=model))
+    assert python == numpy, "engines disagree"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Time the hot usage_snapshot queries as history grows, on three layouts.
+
+`flat` is the table and indexes of migration 001, `partitioned` the
+monthly partitions and partial index of migration 006, and `compacted` the
+same with months past SNAPSHOT_COMPACT_AFTER_MONTHS merged into monthly
+rows as snapshot maintenance does. History is added one step at a time
+(ending today, --developers x --models rows per day) and after each step
+every query is timed against the current month window. Needs the database
+from DATABASE_* settings; tables are created in a scratch schema that is
+dropped afterwards.
+
+    python -m benchmarks.partitioned_history --months 36 --step 6
+"""
+import argparse
+import statistics
+import time
+from datetime import date, timedelta
+
+import psycopg2
+
+from app.config import get_settings
+from app.repositories.usage_repo import COUNTER_COLUMNS
+from app.services.snapshot_maintenance import add_months
+
+SCHEMA = "benchmark_partitioned_history"
+
+COLUMNS = f"""
+    entity_id VARCHAR(32) NOT NULL,
+    active BOOLEAN DEFAULT TRUE,
+    api_key_id VARCHAR(255) NOT NULL,
+    snapshot_date DATE NOT NULL,
+    model VARCHAR(100) NOT NULL,
+    {", ".join(f"{c} BIGINT NOT NULL DEFAULT 0" for c in COUNTER_COLUMNS)},
+    fetched_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+"""
+
+LAYOUTS = {
+    "flat": f"""
+        CREATE TABLE flat ({COLUMNS}, PRIMARY KEY (entity_id));
+        CREATE UNIQUE INDEX ON flat (api_key_id, snapshot_date, model);
+        CREATE INDEX ON flat (snapshot_date);
+        CREATE INDEX ON flat (model);
+    """,
+    **{
+        name: f"""
+            CREATE TABLE {name} ({COLUMNS}, PRIMARY KEY (entity_id, snapshot_date)) PARTITION BY RANGE (snapshot_date);
+            CREATE UNIQUE INDEX ON {name} (api_key_id, snapshot_date, model);
+            CREATE INDEX ON {name} (snapshot_date, model) WHERE active = true;
+        """
+        for name in ("partitioned", "compacted")
+    },
+}
+
+# The reads behind the month leaderboard (all models and one), and a developer's 30-day stats
+QUERIES = {
+    "month": "SELECT api_key_id, model, {counters} FROM {table} "
+             "WHERE snapshot_date >= %(start)s AND snapshot_date <= %(end)s AND active = true",
+    "month/model": "SELECT api_key_id, model, {counters} FROM {table} "
+                   "WHERE snapshot_date >= %(start)s AND snapshot_date <= %(end)s AND active = true AND model = 'model-0'",
+    "developer": "SELECT snapshot_date, {counters} FROM {table} "
+                 "WHERE api_key_id = 'apikey_00000001' AND snapshot_date >= %(start)s AND snapshot_date <= %(end)s "
+                 "AND active = true",
+}
+
+
+def ensure_partitions(cursor, table: str, start: date, end: date):
+    month = start.replace(day=1)
+    while month <= end:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {table}_{month:%Y_%m} PARTITION OF {table} "
+            f"FOR VALUES FROM (%s) TO (%s)",
+            (month, add_months(month, 1)),
+        )
+        month = add_months(month, 1)
+
+
+def add_history(cursor, table: str, start: date, end: date, developers: int, models: int):
+    if table != "flat":
+        ensure_partitions(cursor, table, start, end)
+    cursor.execute(
+        f"""
+        INSERT INTO {table} (entity_id, api_key_id, snapshot_date, model, {", ".join(COUNTER_COLUMNS)})
+        SELECT md5(random()::text), 'apikey_' || lpad(d::text, 8, '0'), day::date, 'model-' || m,
+               {", ".join("(random() * 10000)::bigint" for _ in COUNTER_COLUMNS)}
+        FROM generate_series(%s::date, %s::date, interval '1 day') day,
+             generate_series(1, %s) d, generate_series(0, %s - 1) m
+        """,
+        (start, end, developers, models),
+    )
+
+
+def compact(cursor, table: str, before: date):
+    """Merge every row before `before` into monthly rows; idempotent, so re-running over compacted months is fine."""
+    counters = ", ".join(COUNTER_COLUMNS)
+    cursor.execute(
+        f"""
+        WITH removed AS (
+            DELETE FROM {table} WHERE snapshot_date < %s RETURNING *
+        )
+        INSERT INTO {table} (entity_id, api_key_id, snapshot_date, model, {counters})
+        SELECT md5(random()::text), api_key_id, date_trunc('month', snapshot_date)::date, model,
+               {", ".join(f"SUM({c})" for c in COUNTER_COLUMNS)}
+        FROM removed
+        GROUP BY 2, 3, 4
+        """,
+        (before,),
+    )
+
+
+def time_query(cursor, sql: str, params: dict, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--months", type=int, default=36, help="History to grow to")
+    parser.add_argument("--step", type=int, default=6, help="Months added per step")
+    parser.add_argument("--developers", type=int, default=200)
+    parser.add_argument("--models", type=int, default=3)
+    parser.add_argument("--compact-after-months", type=int, default=get_settings().snapshot_compact_after_months)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    today = date.today()
+    window = {"start": today - timedelta(days=30), "end": today}
+    connection = psycopg2.connect(get_settings().database_url)
+    cursor = connection.cursor()
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}; SET search_path = {SCHEMA}")
+    for ddl in LAYOUTS.values():
+        cursor.execute(ddl)
+    connection.commit()
+
+    print(f"{args.developers} developers x {args.models} models per day, median of {args.repeat} runs (ms)")
+    print(f"{'history':>8} {'layout':<12} {'rows':>10} " + " ".join(f"{q:>12}" for q in QUERIES))
+    try:
+        covered_from = today + timedelta(days=1)
+        for months in range(args.step, args.months + 1, args.step):
+            start = add_months(today.replace(day=1), -months + 1)
+            for table in LAYOUTS:
+                add_history(cursor, table, start, covered_from - timedelta(days=1), args.developers, args.models)
+            if args.compact_after_months > 0:
+                compact(cursor, "compacted", add_months(today.replace(day=1), -args.compact_after_months))
+            connection.commit()
+            covered_from = start
+            for table in LAYOUTS:
+                cursor.execute(f"ANALYZE {table}")
+                cursor.execute(f"SELECT COUNT(*) FROM {table}")
+                rows = cursor.fetchone()[0]
+                timings = [
+                    time_query(cursor, sql.format(table=table, counters=", ".join(COUNTER_COLUMNS)), window, args.repeat)
+                    for sql in QUERIES.values()
+                ]
+                connection.commit()
+                print(f"{months:>7}m {table:<12} {rows:>10} " + " ".join(f"{t:>12.2f}" for t in timings))
+    finally:
+        connection.rollback()
+        cursor.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+        connection.commit()
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
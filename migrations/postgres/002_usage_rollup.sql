@@ -0,0 +1,27 @@
+-- Pre-aggregated per-developer totals for the leaderboard windows (day/week/month).
+-- Maintained by the fetch job; rebuild with `python -m app.cli rebuild-rollups`.
+-- model = '*' holds the all-models total for a developer.
+CREATE TABLE IF NOT EXISTS usage_rollup (
+    period VARCHAR(8) NOT NULL,
+    model VARCHAR(100) NOT NULL,
+    api_key_id VARCHAR(255) NOT NULL,
+    uncached_input_tokens BIGINT NOT NULL DEFAULT 0,
+    cache_read_input_tokens BIGINT NOT NULL DEFAULT 0,
+    cache_creation_5m_tokens BIGINT NOT NULL DEFAULT 0,
+    cache_creation_1h_tokens BIGINT NOT NULL DEFAULT 0,
+    output_tokens BIGINT NOT NULL DEFAULT 0,
+    web_search_requests BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (period, model, api_key_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_usage_rollup_api_key_id
+    ON usage_rollup(api_key_id);
+
+-- Window each period's rollup was last computed for. Rollups whose window_end
+-- is not today are stale and the leaderboard falls back to usage_snapshot.
+CREATE TABLE IF NOT EXISTS usage_rollup_state (
+    period VARCHAR(8) PRIMARY KEY,
+    window_start DATE NOT NULL,
+    window_end DATE NOT NULL,
+    computed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
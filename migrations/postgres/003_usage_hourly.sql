@@ -0,0 +1,25 @@
+-- Hourly usage buckets as reported by the Admin API. Daily usage_snapshot rows
+-- for recent days are the sums of these; old buckets are pruned by the fetch job.
+CREATE TABLE IF NOT EXISTS usage_hourly (
+    api_key_id VARCHAR(255) NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    model VARCHAR(100) NOT NULL DEFAULT 'unknown',
+    uncached_input_tokens BIGINT NOT NULL DEFAULT 0,
+    cache_read_input_tokens BIGINT NOT NULL DEFAULT 0,
+    cache_creation_5m_tokens BIGINT NOT NULL DEFAULT 0,
+    cache_creation_1h_tokens BIGINT NOT NULL DEFAULT 0,
+    output_tokens BIGINT NOT NULL DEFAULT 0,
+    web_search_requests INTEGER NOT NULL DEFAULT 0,
+    fetched_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (api_key_id, bucket_start, model)
+);
+
+CREATE INDEX IF NOT EXISTS idx_usage_hourly_bucket_start
+    ON usage_hourly(bucket_start);
+
+-- High-watermarks for incremental ingestion (UTC, start of the first hour not yet complete).
+CREATE TABLE IF NOT EXISTS ingestion_watermark (
+    name VARCHAR(64) PRIMARY KEY,
+    watermark TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,10 @@
+-- One row per completed backfill window, so an interrupted backfill resumes
+-- where it stopped instead of starting over.
+CREATE TABLE IF NOT EXISTS backfill_checkpoint (
+    job_name VARCHAR(128) NOT NULL,
+    window_start DATE NOT NULL,
+    window_end DATE NOT NULL,
+    snapshots_written INTEGER NOT NULL DEFAULT 0,
+    completed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (job_name, window_start, window_end)
+);
@@ -0,0 +1,17 @@
+-- Every model that has usage, maintained by the snapshot upsert, so listing
+-- models never scans usage_snapshot. first_seen / last_seen are the earliest
+-- and latest snapshot_date with usage; snapshot_count is the number of
+-- usage_snapshot rows for the model.
+CREATE TABLE IF NOT EXISTS model_catalog (
+    model VARCHAR(100) PRIMARY KEY,
+    first_seen DATE NOT NULL,
+    last_seen DATE NOT NULL,
+    snapshot_count BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO model_catalog (model, first_seen, last_seen, snapshot_count)
+SELECT model, MIN(snapshot_date), MAX(snapshot_date), COUNT(*)
+FROM usage_snapshot
+WHERE active = true
+GROUP BY model
+ON CONFLICT (model) DO NOTHING;
@@ -0,0 +1,82 @@
+-- Range-partition usage_snapshot by month (usage_snapshot_YYYY_MM).
+-- Future partitions are created by the scheduler's daily snapshot maintenance
+-- (and on demand before snapshots are written); see app/services/snapshot_maintenance.py.
+
+-- Create the missing monthly partitions covering [from_date, to_date].
+-- Serialized with an advisory lock so concurrent writers don't race to create the same one.
+CREATE OR REPLACE FUNCTION ensure_usage_snapshot_partitions(from_date DATE, to_date DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    month DATE := date_trunc('month', from_date)::date;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('ensure_usage_snapshot_partitions'));
+    WHILE month <= to_date LOOP
+        partition_name := 'usage_snapshot_' || to_char(month, 'YYYY_MM');
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF usage_snapshot FOR VALUES FROM (%L) TO (%L)',
+                partition_name, month, (month + interval '1 month')::date
+            );
+            created := created + 1;
+        END IF;
+        month := (month + interval '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'usage_snapshot'::regclass) = 'p' THEN
+        RETURN;  -- already partitioned
+    END IF;
+
+    ALTER TABLE usage_snapshot RENAME TO usage_snapshot_unpartitioned;
+    ALTER TABLE usage_snapshot_unpartitioned RENAME CONSTRAINT usage_snapshot_pkey TO usage_snapshot_unpartitioned_pkey;
+    ALTER INDEX idx_usage_snapshot_api_key_date_model RENAME TO idx_usage_snapshot_unpartitioned_key;
+
+    -- Partitioned tables need the partition key in every unique constraint,
+    -- so the primary key becomes (entity_id, snapshot_date)
+    CREATE TABLE usage_snapshot (
+        entity_id VARCHAR(32) NOT NULL,
+        version VARCHAR(32),
+        previous_version VARCHAR(32),
+        active BOOLEAN DEFAULT TRUE,
+        changed_by_id VARCHAR(32),
+        changed_on TIMESTAMP,
+        latest BOOLEAN DEFAULT TRUE,
+        api_key_id VARCHAR(255) NOT NULL,
+        snapshot_date DATE NOT NULL,
+        model VARCHAR(100) NOT NULL DEFAULT 'unknown',
+        uncached_input_tokens BIGINT NOT NULL DEFAULT 0,
+        cache_read_input_tokens BIGINT NOT NULL DEFAULT 0,
+        cache_creation_5m_tokens BIGINT NOT NULL DEFAULT 0,
+        cache_creation_1h_tokens BIGINT NOT NULL DEFAULT 0,
+        output_tokens BIGINT NOT NULL DEFAULT 0,
+        web_search_requests INTEGER NOT NULL DEFAULT 0,
+        fetched_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        extra JSONB,
+        PRIMARY KEY (entity_id, snapshot_date)
+    ) PARTITION BY RANGE (snapshot_date);
+
+    CREATE UNIQUE INDEX idx_usage_snapshot_api_key_date_model
+        ON usage_snapshot(api_key_id, snapshot_date, model);
+
+    -- Every read filters on active = true; the date and model indexes of 001 are replaced by this one
+    CREATE INDEX idx_usage_snapshot_active_date_model
+        ON usage_snapshot(snapshot_date, model) WHERE active = true;
+
+    PERFORM ensure_usage_snapshot_partitions(
+        COALESCE((SELECT MIN(snapshot_date) FROM usage_snapshot_unpartitioned), CURRENT_DATE),
+        GREATEST(
+            (SELECT MAX(snapshot_date) FROM usage_snapshot_unpartitioned),
+            (CURRENT_DATE + interval '3 months')::date
+        )
+    );
+
+    INSERT INTO usage_snapshot SELECT * FROM usage_snapshot_unpartitioned;
+    DROP TABLE usage_snapshot_unpartitioned;
+END;
+$$;
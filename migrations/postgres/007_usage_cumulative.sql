@@ -0,0 +1,43 @@
+-- Running per-developer, per-model totals of usage_snapshot, for leaderboards
+-- over arbitrary date ranges: the total for [start, end] is the row covering
+-- end minus the row covering start - 1, whatever the length of the range.
+-- One row per snapshot; it holds the totals up to and including snapshot_date
+-- and is current until valid_until (exclusive, 'infinity' for the latest row).
+-- Maintained by the fetch job; rebuild with `python -m app.cli rebuild-rollups`.
+CREATE TABLE IF NOT EXISTS usage_cumulative (
+    api_key_id VARCHAR(255) NOT NULL,
+    model VARCHAR(100) NOT NULL,
+    snapshot_date DATE NOT NULL,
+    valid_until DATE NOT NULL,
+    uncached_input_tokens BIGINT NOT NULL DEFAULT 0,
+    cache_read_input_tokens BIGINT NOT NULL DEFAULT 0,
+    cache_creation_5m_tokens BIGINT NOT NULL DEFAULT 0,
+    cache_creation_1h_tokens BIGINT NOT NULL DEFAULT 0,
+    output_tokens BIGINT NOT NULL DEFAULT 0,
+    web_search_requests BIGINT NOT NULL DEFAULT 0,
+    -- When this row's totals last changed
+    computed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (api_key_id, model, snapshot_date)
+);
+
+-- Finds the one row per (api_key_id, model) current on a given day
+CREATE INDEX IF NOT EXISTS idx_usage_cumulative_validity
+    ON usage_cumulative USING gist (daterange(snapshot_date, valid_until));
+
+INSERT INTO usage_cumulative (
+    api_key_id, model, snapshot_date, valid_until,
+    uncached_input_tokens, cache_read_input_tokens, cache_creation_5m_tokens,
+    cache_creation_1h_tokens, output_tokens, web_search_requests
+)
+SELECT api_key_id, model, snapshot_date,
+       COALESCE(LEAD(snapshot_date) OVER w, 'infinity'),
+       SUM(uncached_input_tokens) OVER w,
+       SUM(cache_read_input_tokens) OVER w,
+       SUM(cache_creation_5m_tokens) OVER w,
+       SUM(cache_creation_1h_tokens) OVER w,
+       SUM(output_tokens) OVER w,
+       SUM(web_search_requests) OVER w
+FROM usage_snapshot
+WHERE active = true
+WINDOW w AS (PARTITION BY api_key_id, model ORDER BY snapshot_date)
+ON CONFLICT DO NOTHING;
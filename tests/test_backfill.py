@@ -0,0 +1,51 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app.services.backfill import split_windows
+
+
+def test_windows_are_aligned_and_clipped_to_the_range():
+    windows = split_windows(date(2024, 1, 10), date(2024, 2, 20), 7)
+
+    assert windows[0][0] == date(2024, 1, 10)
+    assert windows[-1][1] == date(2024, 2, 20)
+    for (_, end), (next_start, _) in zip(windows, windows[1:]):
+        assert next_start == end + timedelta(days=1)
+    # Interior boundaries fall on multiples of window_days since date.min
+    for start, end in windows[1:-1]:
+        assert (start.toordinal() - 1) % 7 == 0
+        assert (end - start).days == 6
+
+
+def test_overlapping_ranges_share_interior_windows():
+    first = split_windows(date(2024, 1, 1), date(2024, 3, 31), 10)
+    second = split_windows(date(2024, 1, 4), date(2024, 4, 15), 10)
+
+    assert set(first[1:-1]) <= set(second)
+
+
+def test_range_inside_one_window_is_a_single_window():
+    aligned = date.fromordinal(1 + 30 * 24000)
+
+    assert split_windows(aligned + timedelta(days=3), aligned + timedelta(days=8), 30) == [
+        (aligned + timedelta(days=3), aligned + timedelta(days=8))
+    ]
+    assert split_windows(aligned, aligned + timedelta(days=29), 30) == [(aligned, aligned + timedelta(days=29))]
+    assert split_windows(date(2024, 5, 5), date(2024, 5, 5), 7) == [(date(2024, 5, 5), date(2024, 5, 5))]
+
+
+def test_empty_range_has_no_windows():
+    assert split_windows(date(2024, 5, 6), date(2024, 5, 5), 7) == []
+
+
+@pytest.mark.parametrize("window_days", [1, 3, 7, 30])
+def test_windows_cover_every_day_exactly_once(window_days):
+    start, end = date(2023, 12, 20), date(2024, 3, 3)
+    days = [
+        window_start + timedelta(days=i)
+        for window_start, window_end in split_windows(start, end, window_days)
+        for i in range((window_end - window_start).days + 1)
+    ]
+
+    assert days == [start + timedelta(days=i) for i in range((end - start).days + 1)]
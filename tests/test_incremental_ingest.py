@@ -0,0 +1,92 @@
+import asyncio
+import uuid
+from datetime import date, datetime, timedelta
+
+import psycopg2
+import pytest
+
+from app.config import get_settings
+from app.database import create_adapter
+from app.models import UsageSnapshot
+from app.repositories import UsageSnapshotRepository
+from app.services.scheduler import get_ingest_start, ingest_hourly_report, store_snapshots
+
+HOURLY_OUTPUT = 10
+
+
+@pytest.fixture
+def adapter():
+    try:
+        adapter = create_adapter()
+        with adapter:
+            adapter.execute_query("SELECT 1")
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL not reachable: {e}")
+    yield adapter
+    adapter.close_connection()
+
+
+@pytest.fixture
+def api_key_id(adapter):
+    api_key_id = f"test_ingest_{uuid.uuid4().hex}"
+    yield api_key_id
+    with adapter.transaction() as cursor:
+        for table in ("usage_snapshot", "usage_hourly", "usage_rollup", "usage_cumulative"):
+            cursor.execute(f"DELETE FROM {table} WHERE api_key_id = %s", (api_key_id,))
+        cursor.execute("DELETE FROM model_catalog WHERE model = %s", (api_key_id,))
+
+
+def hourly_report(api_key_id: str, starting_at: datetime, ending_at: datetime):
+    """A report with HOURLY_OUTPUT output tokens in every hour, one bucket per page."""
+    async def pages():
+        hour = starting_at
+        while hour < ending_at:
+            yield [{
+                "starting_at": hour.isoformat() + "Z",
+                "results": [{"api_key_id": api_key_id, "model": api_key_id, "output_tokens": HOURLY_OUTPUT}],
+            }]
+            hour += timedelta(hours=1)
+    return pages()
+
+
+def run_cycle(adapter, api_key_id: str, watermark, current_hour: datetime):
+    starting_at = get_ingest_start(watermark, current_hour)
+    # The watermark is threaded through by hand so the shared one is left alone
+    pages = hourly_report(api_key_id, starting_at, current_hour + timedelta(hours=1))
+    asyncio.run(ingest_hourly_report(adapter, pages, {api_key_id}))
+    return current_hour
+
+
+def output_on(adapter, api_key_id: str, day: date) -> int:
+    rows = UsageSnapshotRepository(adapter).get_counters_for_period(day, day, model=api_key_id)
+    return sum(row.output_tokens for row in rows if row.api_key_id == api_key_id)
+
+
+@pytest.mark.parametrize("lookback_hours, hour", [(1, 0), (24, 10), (48, 23)])
+def test_ingest_start_is_midnight(monkeypatch, lookback_hours, hour):
+    monkeypatch.setattr(get_settings(), "ingest_lookback_hours", lookback_hours)
+    current_hour = datetime(2024, 3, 10, hour)
+
+    assert get_ingest_start(None, current_hour) == datetime(2024, 3, 10)
+    start = get_ingest_start(current_hour, current_hour)
+    assert start.time() == datetime.min.time()
+    assert start <= current_hour - timedelta(hours=lookback_hours) < start + timedelta(days=1)
+
+
+def test_second_cycle_keeps_backfilled_yesterday(adapter, api_key_id):
+    today = datetime.utcnow().date()
+    yesterday = today - timedelta(days=1)
+    store_snapshots(adapter, [UsageSnapshot(
+        api_key_id=api_key_id,
+        snapshot_date=yesterday,
+        model=api_key_id,
+        output_tokens=24 * HOURLY_OUTPUT,
+        fetched_at=datetime.utcnow(),
+    )])
+
+    # Fresh install: the first run reads from midnight today, the next one looks back into yesterday
+    watermark = run_cycle(adapter, api_key_id, None, datetime.combine(today, datetime.min.time()) + timedelta(hours=10))
+    run_cycle(adapter, api_key_id, watermark, watermark + timedelta(hours=1))
+
+    assert output_on(adapter, api_key_id, yesterday) == 24 * HOURLY_OUTPUT
+    assert output_on(adapter, api_key_id, today) == 12 * HOURLY_OUTPUT
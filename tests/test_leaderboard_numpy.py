@@ -0,0 +1,61 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.models import UsageCounters  # noqa: E402
+from app.repositories.rollup_repo import percentage  # noqa: E402
+from app.services.leaderboard import aggregate_snapshots, rank_categories  # noqa: E402
+from app.services.leaderboard_numpy import UsageColumns, _percent, rank_columns  # noqa: E402
+
+MODELS = ("claude-opus", "claude-sonnet", "claude-haiku")
+
+
+def random_rows(rng: random.Random):
+    """Few developers and small counters, so ties, zero inputs and 0.xx5 percentages are common."""
+    developers = rng.randint(0, 25)
+    scale = rng.choice((3, 50, 10 ** 6, 2 ** 62 // 1000))
+    rows = []
+    for _ in range(rng.randint(0, 120)):
+        rows.append(UsageCounters(
+            api_key_id=f"key_{rng.randrange(max(developers, 1))}",
+            snapshot_date=date(2024, 1, 1) + timedelta(days=rng.randrange(31)),
+            model=rng.choice(MODELS),
+            uncached_input_tokens=rng.randrange(scale) if rng.random() > 0.2 else 0,
+            cache_read_input_tokens=rng.randrange(scale) if rng.random() > 0.2 else 0,
+            cache_creation_5m_tokens=rng.randrange(scale),
+            cache_creation_1h_tokens=rng.randrange(scale),
+            output_tokens=rng.randrange(scale),
+            web_search_requests=rng.randrange(4),
+        ))
+    return rows
+
+
+def comparable(categories):
+    # Compare value types too: the response must serialize identically (0 vs 0.0)
+    return {
+        category: [(e["api_key_id"], e["rank"], e["value"], type(e["value"])) for e in entries]
+        for category, entries in categories.items()
+    }
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_rank_columns_matches_python_engine(seed):
+    rng = random.Random(seed)
+    rows = random_rows(rng)
+    model = rng.choice((None, *MODELS, "unknown-model"))
+
+    expected = rank_categories(aggregate_snapshots(r for r in rows if model is None or r.model == model))
+    assert comparable(rank_columns(UsageColumns(rows), model)) == comparable(expected.categories)
+
+
+@pytest.mark.parametrize("largest", [10 ** 6, 2 ** 53 // 20000, 2 ** 53 // 20000 + 1, 2 ** 62])
+def test_percent_matches_percentage_on_both_sides_of_the_int64_limit(largest):
+    rng = random.Random(largest)
+    part = [largest] + [rng.randrange(largest) for _ in range(500)]
+    whole = [0, 1, 3, 32, 20000] + [rng.randrange(max(largest // rng.choice((1, 7, 10 ** 4)), 1)) for _ in range(496)]
+    expected = [percentage(p, w) if w > 0 else 0 for p, w in zip(part, whole)]
+
+    assert _percent(np.array(part, dtype=np.int64), np.array(whole, dtype=np.int64), 0) == expected
@@ -0,0 +1,91 @@
+import random
+from decimal import ROUND_HALF_UP, Decimal
+from fractions import Fraction
+
+import psycopg2
+import pytest
+
+from app.config import get_settings
+from app.repositories.rollup_repo import CATEGORY_VALUE_SQL, percentage
+from app.services.leaderboard import rank_categories
+
+COLUMNS = ("uncached_input_tokens", "cache_read_input_tokens", "output_tokens", "web_search_requests")
+
+
+def random_totals(rng: random.Random, developers: int):
+    """Small denominators, so exact .xx5 ties (1/32 = 3.125%) come up often."""
+    totals = {}
+    for i in range(developers):
+        scale = rng.choice((10, 400, 10 ** 6, 10 ** 12))
+        totals[f"key_{i}"] = {
+            "uncached_input_tokens": rng.randrange(scale),
+            "cache_read_input_tokens": rng.randrange(scale),
+            "output_tokens": rng.randrange(scale),
+            "web_search_requests": rng.randrange(5),
+            "cache_creation_5m_tokens": 0,
+            "cache_creation_1h_tokens": 0,
+        }
+    return totals
+
+
+@pytest.fixture(scope="module")
+def connection():
+    settings = get_settings()
+    try:
+        conn = psycopg2.connect(
+            host=settings.database_host,
+            port=settings.database_port,
+            user=settings.database_user,
+            password=settings.database_password,
+            database=settings.database_name,
+            connect_timeout=3,
+        )
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL not reachable: {e}")
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize("part, whole, expected", [(1, 32, 3.13), (201, 20000, 1.01), (2, 3, 66.67), (0, 0, 0.0)])
+def test_percentage_rounds_half_up(part, whole, expected):
+    assert percentage(part, whole) == expected
+
+
+def test_percentage_matches_exact_decimal_rounding():
+    rng = random.Random(15)
+    for _ in range(20000):
+        whole = rng.randrange(1, rng.choice((50, 10 ** 4, 10 ** 15)))
+        part = rng.randrange(whole * 3)
+        exact = Decimal(Fraction(part * 100, whole).numerator) / Decimal(Fraction(part * 100, whole).denominator)
+        expected = float(exact.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
+        assert percentage(part, whole) == expected, (part, whole)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_sql_scores_and_ranks_match_rank_categories(connection, seed):
+    totals = random_totals(random.Random(seed), 300)
+    ranked = rank_categories(totals)
+    categories = list(CATEGORY_VALUE_SQL)
+
+    rows = [(key, *(t[c] for c in COLUMNS)) for key, t in totals.items()]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT api_key_id, {", ".join(f"{c}, RANK() OVER (ORDER BY {c} DESC)" for c in categories)}
+            FROM (
+                SELECT api_key_id, {", ".join(f"{CATEGORY_VALUE_SQL[c]} AS {c}" for c in categories)}
+                FROM (VALUES {", ".join(["(%s, %s::bigint, %s::bigint, %s::bigint, %s::bigint)"] * len(rows))})
+                    AS usage_rollup(api_key_id, {", ".join(COLUMNS)})
+            ) scores
+            """,
+            [value for row in rows for value in row],
+        )
+        results = cursor.fetchall()
+
+    assert len(results) == len(totals)
+    for api_key_id, *scored in results:
+        for i, category in enumerate(categories):
+            entry = ranked.entry(category, api_key_id)
+            value, rank = scored[2 * i], scored[2 * i + 1]
+            assert float(value) == entry["value"], (category, api_key_id)
+            assert rank == entry["rank"], (category, api_key_id)